@@ -0,0 +1,36 @@
+"""Rows per second of Table.create_segment vs Table.import_segments.
+
+Imports the segments of the Choi tree into a temporary db, one commit per
+segment with create_segment and one transaction per batch with
+import_segments. Run from the repository root:
+
+    python -m benchmarks.bench_db_import
+"""
+import time
+
+from benchmarks.db_helpers import dbv2, iter_choi_segments, temporary_db
+
+# create_segment commits every segment, so it only gets part of the tree
+CREATE_SEGMENT_LIMIT = 2000
+
+
+def main():
+    with temporary_db():
+        table = dbv2.Table("create_segment")
+        start = time.perf_counter()
+        num_rows = 0
+        for segment in iter_choi_segments(CREATE_SEGMENT_LIMIT):
+            table.create_segment(segment)
+            num_rows += len(segment)
+        seconds = time.perf_counter() - start
+        print(f"create_segment: {num_rows} rows in {seconds:5.2f} s, {num_rows / seconds:,.0f} rows/s")
+        table.conn.close()
+
+        table = dbv2.Table("import_segments")
+        stats = table.import_segments(iter_choi_segments())
+        print(f"import_segments: {stats['rows']} rows in {stats['seconds']:5.2f} s, {stats['rows_per_second']:,.0f} rows/s")
+        table.conn.close()
+
+
+if __name__ == "__main__":
+    main()
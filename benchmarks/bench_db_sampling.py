@@ -0,0 +1,46 @@
+"""Time to sample segments one query per segment vs with DB.get_segments.
+
+The Choi tree is imported into a temporary db under a WikiSection name,
+since get_target_sentence_ids reads the wikisection_<name>_train_test
+table. Run from the repository root:
+
+    python -m benchmarks.bench_db_sampling
+"""
+import time
+
+from benchmarks.db_helpers import dbv2, import_choi, temporary_db
+
+NUM_SEGMENTS = 5000
+# each way is timed this many times and the fastest run is printed
+REPEATS = 5
+
+
+def best_of(read):
+    seconds = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = read()
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def main():
+    with temporary_db():
+        table = import_choi("city")
+        train_test = dbv2.TrainTestTable("city")
+        train_test.create_train_test_split()
+        segment_ids = [row[1] for row in table.get_target_sentence_ids("train", NUM_SEGMENTS, seed=0)]
+
+        one_by_one, seconds = best_of(lambda: [table.get_segment(segment_id) for segment_id in segment_ids])
+        print(f"get_segment per segment: {len(one_by_one)} segments in {seconds:6.3f} s")
+
+        segments, seconds = best_of(lambda: table.get_segments(segment_ids))
+        print(f"get_segments:            {len(segments)} segments in {seconds:6.3f} s")
+        assert segments == one_by_one
+
+        train_test.conn.close()
+        table.conn.close()
+
+
+if __name__ == "__main__":
+    main()
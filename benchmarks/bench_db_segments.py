@@ -0,0 +1,45 @@
+"""Peak memory of reading every segment with get_all vs DB.iter_segments.
+
+The Choi tree is imported into a temporary db first. Run from the
+repository root:
+
+    python -m benchmarks.bench_db_segments
+"""
+import time
+import tracemalloc
+
+from benchmarks.db_helpers import import_choi, temporary_db
+
+
+def as_segments(rows):
+    # what get_all_segments built from get_all before it streamed
+    segments = []
+    for row in rows:
+        if row[2] == 1 or not segments:
+            segments.append([])
+        segments[-1].append(row)
+    return segments
+
+
+def measure(name, read):
+    tracemalloc.start()
+    start = time.perf_counter()
+    num_segments = read()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>32}: {num_segments} segments in {seconds:5.2f} s, {peak / 2**20:6.1f} MiB peak")
+
+
+def main():
+    with temporary_db():
+        table = import_choi("choi")
+
+        measure("get_all", lambda: len(as_segments(table.get_all())))
+        measure("iter_segments", lambda: sum(1 for _ in table.iter_segments()))
+        measure("iter_segments(sentence, target)", lambda: sum(1 for _ in table.iter_segments(columns=("sentence", "target"))))
+        table.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Segmentation time of EmbeddingSegmenter once the embeddings are computed.
+
+Uses random unit embeddings sized like a full Choi table, so the numbers
+exclude the embedding model. Run from the repository root:
+
+    python -m benchmarks.bench_embedding_segmenter
+"""
+import time
+
+import numpy as np
+
+from src.segmenter import EmbeddingSegmenter, normalize
+
+NUM_DOCUMENTS = 700
+SENTENCES_PER_DOCUMENT = 70
+EMBEDDING_SIZE = 768
+
+
+class NoEmbeddings:
+    def embed_documents(self, texts):
+        raise AssertionError("the benchmark segments precomputed embeddings")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    embeddings = normalize(rng.normal(size=(NUM_DOCUMENTS * SENTENCES_PER_DOCUMENT, EMBEDDING_SIZE)))
+    segmenter = EmbeddingSegmenter(embedding_function=NoEmbeddings())
+
+    start = time.perf_counter()
+    for i in range(NUM_DOCUMENTS):
+        segmenter.segment(embeddings[i * SENTENCES_PER_DOCUMENT:(i + 1) * SENTENCES_PER_DOCUMENT])
+    seconds = time.perf_counter() - start
+    num_sentences = len(embeddings)
+    print(f"{NUM_DOCUMENTS} documents, {num_sentences} sentences: {seconds:.3f} s, {num_sentences / seconds:,.0f} sentences/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Per-sentence prompt building overhead, ChatPromptTemplate vs CompiledPrompt.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_prompt_building
+"""
+import timeit
+import tracemalloc
+
+from langchain.prompts import ChatPromptTemplate
+
+from src.determinor import QUERY_PROMPT
+from src.prompt_template import CompiledPrompt
+
+NUM_SENTENCES = 20000
+
+PREV_PARAGRAPH = "\n".join(
+    [
+        "Some of the features of the top portions of Figure 1 and Figure 2 were mentioned in discussing Table 1 .",
+        "First , the Onset Profile spreads across approximately 12 years for boys and 10 years for girls .",
+        "The Maturity Chart for each sex demonstrates clearly that Onset is a phenomenon of infancy .",
+    ]
+)
+SENTENCE = "Completion is a phenomenon of the later portion of adolescence ."
+
+
+def build_per_call():
+    # what Determinor.query did for every sentence
+    prompt_template = ChatPromptTemplate.from_template(QUERY_PROMPT)
+    return prompt_template.format(prev_paragraph=PREV_PARAGRAPH, sentence=SENTENCE)
+
+
+compiled_prompt = CompiledPrompt(QUERY_PROMPT)
+
+
+def build_compiled():
+    return compiled_prompt.format(prev_paragraph=PREV_PARAGRAPH, sentence=SENTENCE)
+
+
+def measure(name, fn):
+    seconds = min(timeit.repeat(fn, number=NUM_SENTENCES, repeat=3))
+    tracemalloc.start()
+    for _ in range(1000):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>20}: {seconds / NUM_SENTENCES * 1e6:8.2f} us/sentence, {seconds:6.3f} s per {NUM_SENTENCES} sentences, peak traced {peak / 1024:8.1f} KiB")
+    return seconds
+
+
+def main():
+    assert build_per_call() == build_compiled()
+    before = measure("ChatPromptTemplate", build_per_call)
+    after = measure("CompiledPrompt", build_compiled)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Per-pair vs batched retrieval of RAG.query_batch_data on the choi 3-11 documents.
+
+Indexes every sentence of data/choi/1/3-11 in an in-memory Chroma collection
+and retrieves the context of every sentence pair of each document, once with
+a search per pair and once with RAG.search_batch. Both go through
+CachedEmbeddings with an empty store each, as RAG() does by default, and
+embedding requests are counted at the wrapped embeddings. Embeddings are
+hashed bags of words so the timings cover retrieval only. Run from the
+repository root:
+
+    python -m benchmarks.bench_rag_retrieval
+"""
+import glob
+import os
+import re
+import tempfile
+import time
+import zlib
+
+import chromadb
+import numpy as np
+from langchain.vectorstores.chroma import Chroma
+
+from src.embedding_store import CachedEmbeddings, EmbeddingStore
+from src.rag import RAG, RETRIEVED_CHUNKS, query_prompt_template
+
+DATA_PATH = os.path.join("data", "choi", "1", "3-11")
+EMBEDDING_SIZE = 384
+
+
+class HashingEmbeddings:
+    """Unit-length hashed bags of words, counting the requests a model would get."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), EMBEDDING_SIZE), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode("utf-8")) % EMBEDDING_SIZE] += 1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        return self.embed(texts).tolist()
+
+    def embed_queries(self, texts):
+        self.requests += 1
+        return self.embed(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+
+def load_documents():
+    documents = []
+    for path in sorted(glob.glob(os.path.join(DATA_PATH, "*.ref"))):
+        with open(path) as f:
+            documents.append([line.strip() for line in f if line.strip() and not line.startswith("==========")])
+    return documents
+
+
+def main():
+    documents = load_documents()
+    embeddings = HashingEmbeddings()
+    sentences = [sentence for document in documents for sentence in document]
+    prompts = [
+        [query_prompt_template.format(sentence_1=s1, sentence_2=s2) for s1, s2 in zip(document, document[1:])]
+        for document in documents
+    ]
+    num_pairs = sum(len(p) for p in prompts)
+    print(f"{len(documents)} documents, {len(sentences)} indexed sentences, {num_pairs} pairs")
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Chroma(collection_name="bench_rag_retrieval", client=chromadb.EphemeralClient(), embedding_function=embeddings)
+        db.add_texts(sentences, ids=[str(i) for i in range(len(sentences))])
+
+        # a store per run, so neither run reads the query vectors of the other
+        db._embedding_function = CachedEmbeddings(embeddings, store=EmbeddingStore(f"{directory}/per_pair"), model_id="hashing")
+        embeddings.requests = 0
+        start = time.perf_counter()
+        per_pair = [[db.similarity_search_with_score(prompt, k=RETRIEVED_CHUNKS) for prompt in document] for document in prompts]
+        seconds = time.perf_counter() - start
+        print(f"{'per pair':>10}: {seconds:6.3f} s, {num_pairs} searches, {embeddings.requests} embedding requests")
+
+        cached = CachedEmbeddings(embeddings, store=EmbeddingStore(f"{directory}/batched"), model_id="hashing")
+        rag = RAG(model=object(), embedding_function=cached, db=db)
+        embeddings.requests = 0
+        start = time.perf_counter()
+        batched = [rag.search_batch(rag.embed_queries(document), k=RETRIEVED_CHUNKS) for document in prompts]
+        batched_seconds = time.perf_counter() - start
+        print(f"{'batched':>10}: {batched_seconds:6.3f} s, {len(prompts)} searches, {embeddings.requests} embedding requests")
+        print(f"speedup: {seconds / batched_seconds:.1f}x")
+
+    same = sum(
+        [doc.page_content for doc, _ in a] == [doc.page_content for doc, _ in b]
+        for document_a, document_b in zip(per_pair, batched)
+        for a, b in zip(document_a, document_b)
+    )
+    print(f"identical top-{RETRIEVED_CHUNKS}: {same}/{num_pairs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Load time and memory of the Choi tree as RefDocuments vs lists of row tuples.
+
+The tuples are shaped like the rows of the db tables, (id, sentence,
+target, parent, sequence). Run from the repository root:
+
+    python -m benchmarks.bench_ref_loader
+"""
+import os
+import time
+import tracemalloc
+
+from src.dataset.choi import iter_ref_documents
+
+DATA_PATH = os.path.join("data", "choi")
+
+
+def as_rows(documents):
+    rows = []
+    for document in documents:
+        parent = None
+        for sequence, (sentence, target) in enumerate(zip(document.sentences, document.labels.tolist())):
+            row_id = len(rows) + 1
+            parent = row_id if target == 1 else parent
+            rows.append((row_id, sentence, target, parent, sequence))
+    return rows
+
+
+def measure(name, load):
+    start = time.perf_counter()
+    load()
+    seconds = time.perf_counter() - start
+    # timed separately, tracing slows allocations down
+    tracemalloc.start()
+    result = load()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>18}: {seconds:5.2f} s, {current / 2**20:6.1f} MiB held, {peak / 2**20:6.1f} MiB peak")
+    return result
+
+
+def main():
+    documents = measure("RefDocument", lambda: list(iter_ref_documents(DATA_PATH)))
+    print(f"{len(documents)} documents, {sum(len(d) for d in documents)} sentences")
+    del documents
+    measure("row tuples", lambda: as_rows(iter_ref_documents(DATA_PATH)))
+
+
+if __name__ == "__main__":
+    main()
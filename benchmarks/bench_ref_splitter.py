@@ -0,0 +1,36 @@
+"""Chunks and embedded characters of RecursiveCharacterTextSplitter vs RefSplitter on data/choi.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ref_splitter
+"""
+import os
+import time
+
+from src.dataset.choi import RefSplitter
+from src.populate_database import iter_files, load_file, split_documents
+
+DATA_PATH = os.path.join("data", "choi")
+
+
+def measure(name, split, paths):
+    start = time.perf_counter()
+    num_chunks = 0
+    num_characters = 0
+    for path in paths:
+        chunks = split(load_file(path))
+        num_chunks += len(chunks)
+        num_characters += sum(len(chunk.page_content) for chunk in chunks)
+    seconds = time.perf_counter() - start
+    print(f"{name:>10}: {num_chunks:7d} chunks, {num_characters / 1e6:6.2f}M characters to embed, {seconds:5.2f} s")
+
+
+def main():
+    paths = list(iter_files([DATA_PATH]))
+    print(f"{len(paths)} files")
+    measure("recursive", split_documents, paths)
+    measure("ref", RefSplitter().split_documents, paths)
+
+
+if __name__ == "__main__":
+    main()
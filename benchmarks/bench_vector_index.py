@@ -0,0 +1,64 @@
+"""Cold-open time and query latency of Chroma vs VectorIndex on the choi 3-11 sentences.
+
+Every sentence of data/choi/1/3-11 is indexed in a persisted Chroma
+directory and in a VectorIndex directory. Queries are timed one at a time,
+and for VectorIndex also as one batch. Embeddings are hashed bags of words
+so the numbers cover the stores only. Run from the repository root:
+
+    python -m benchmarks.bench_vector_index
+"""
+import tempfile
+import time
+
+import numpy as np
+from langchain.vectorstores.chroma import Chroma
+
+from benchmarks.bench_rag_retrieval import HashingEmbeddings, load_documents
+from src.vector_index import VectorIndex
+
+NUM_QUERIES = 200
+K = 5
+
+
+def measure(name, open_store, queries):
+    start = time.perf_counter()
+    store = open_store()
+    open_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    results = [store.similarity_search_by_vector_with_relevance_scores(list(map(float, query)), k=K) for query in queries]
+    query_seconds = (time.perf_counter() - start) / len(queries)
+    print(f"{name:>14}: open {open_seconds * 1000:8.1f} ms, query {query_seconds * 1000:6.2f} ms")
+    return [[distance for _, distance in result] for result in results]
+
+
+def main():
+    sentences = [sentence for document in load_documents() for sentence in document]
+    embeddings = HashingEmbeddings()
+    vectors = embeddings.embed(sentences)
+    queries = vectors[np.random.default_rng(0).choice(len(vectors), NUM_QUERIES, replace=False)]
+    print(f"{len(sentences)} sentences, {NUM_QUERIES} queries, k={K}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        chroma = Chroma(persist_directory=f"{directory}/chroma", embedding_function=embeddings)
+        chroma.add_texts(sentences, ids=[str(i) for i in range(len(sentences))])
+        del chroma
+        start = time.perf_counter()
+        VectorIndex(f"{directory}/index").add_embeddings(sentences, vectors)
+        print(f"{'index':>14}: built in {time.perf_counter() - start:.2f} s")
+
+        chroma_results = measure("chroma", lambda: Chroma(persist_directory=f"{directory}/chroma", embedding_function=embeddings), queries)
+        index_results = measure("index", lambda: VectorIndex(f"{directory}/index"), queries)
+        index = VectorIndex(f"{directory}/index")
+        start = time.perf_counter()
+        index.similarity_search_batch(queries, k=K)
+        print(f"{'index (batch)':>14}: query {(time.perf_counter() - start) / len(queries) * 1000:6.2f} ms")
+
+    def recall(results):
+        # hashed bags of words tie often, so a result counts when it is as close as the exact k-th neighbour
+        return np.mean([np.mean(np.asarray(found) <= exact[-1] + 1e-4) for found, exact in zip(results, index_results)])
+
+    print(f"recall@{K} of chroma against exact search: {recall(chroma_results):.3f}")
+
+
+if __name__ == "__main__":
+    main()
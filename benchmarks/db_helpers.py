@@ -0,0 +1,41 @@
+"""Temporary dbv2 tables filled from the Choi tree, shared by the db benchmarks."""
+from contextlib import contextmanager
+import os
+import tempfile
+
+from src.dataset.choi import iter_ref_documents
+
+DATA_PATH = os.path.abspath(os.path.join("data", "choi"))
+
+# dbv2 changes into the db directory on import, DATA_PATH is resolved first
+from db import dbv2  # noqa: E402
+
+
+def iter_choi_segments(limit=None):
+    """Yield the segments of the Choi tree, at most limit of them."""
+    count = 0
+    for document in iter_ref_documents(DATA_PATH):
+        for segment in document.segments():
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            yield segment
+
+
+@contextmanager
+def temporary_db():
+    """Create the dbv2 tables of the block in a temporary directory."""
+    dname = dbv2.dname
+    with tempfile.TemporaryDirectory() as tmp:
+        dbv2.dname = tmp
+        try:
+            yield
+        finally:
+            dbv2.dname = dname
+
+
+def import_choi(table_name):
+    """A dbv2.Table holding the whole Choi tree, in the current db directory."""
+    table = dbv2.Table(table_name)
+    table.import_segments(iter_choi_segments())
+    return table
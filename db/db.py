@@ -1,9 +1,10 @@
 from cached_property import cached_property
 import sqlite3
 from sqlite3 import Error
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
 import math
 import os
+import time
 import numpy as np
 
 # change the execution path to filepath for relative db file import
@@ -13,6 +14,10 @@ os.chdir(dname)
 
 
 TRAIN_TEST_SPLIT = 0.75
+# rows written per transaction by import_segments
+IMPORT_BATCH_SIZE = 50000
+# page cache used while importing
+IMPORT_CACHE_KIB = 64 * 1024
 
 
 class DB:
@@ -118,7 +123,6 @@ class DB:
             cur = self.conn.cursor()
             # insert the target segment
             cur.execute(sql, (segment[0], 1, None, 0))
-            self.conn.commit()
             target_sentence_id = cur.lastrowid
 
         if len(segment) > 1:
@@ -128,10 +132,79 @@ class DB:
                     (sentence, 0, target_sentence_id, i + 1))
 
             cur.executemany(sql, remaining_segment)
-            self.conn.commit()
 
+        self.conn.commit()
         return target_sentence_id
 
+    def set_bulk_pragmas(self):
+        cur = self.conn.cursor()
+        # readers keep working during an import and commits do not wait for an fsync
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute(f"PRAGMA cache_size=-{IMPORT_CACHE_KIB}")
+
+    def import_segments(self, segments: Iterable[List[str]], batch_size=IMPORT_BATCH_SIZE) -> dict:
+        """Insert segments (lists of sentences) in transactions of about batch_size rows.
+
+        Ids are assigned here rather than read back per row, so every sentence
+        is inserted with its parent in one executemany. Each transaction takes
+        the write lock before reading the largest id, so several processes can
+        import into the same table. Returns the number of rows and segments
+        written and the rows per second.
+        """
+        # the pragmas cannot change the journal inside a transaction
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.set_bulk_pragmas()
+
+        start = time.perf_counter()
+        num_rows = 0
+        num_segments = 0
+        batch = []
+        batch_rows = 0
+        for segment in segments:
+            if len(segment) == 0:
+                continue
+            batch.append(segment)
+            batch_rows += len(segment)
+            if batch_rows >= batch_size:
+                self.insert_segments(batch)
+                num_rows += batch_rows
+                num_segments += len(batch)
+                batch = []
+                batch_rows = 0
+        if batch:
+            self.insert_segments(batch)
+            num_rows += batch_rows
+            num_segments += len(batch)
+
+        seconds = time.perf_counter() - start
+        rows_per_second = num_rows / seconds if seconds > 0 else 0.0
+        print(f"Imported {num_rows} rows ({num_segments} segments) into {self.dataset_type} at {rows_per_second:,.0f} rows/s")
+        return {"rows": num_rows, "segments": num_segments, "seconds": seconds, "rows_per_second": rows_per_second}
+
+    def insert_segments(self, segments: List[List[str]]):
+        """Insert segments in one transaction, numbering their sentences after the largest id."""
+        sql = f""" INSERT INTO {self.dataset_type}(id,sentence,target,parent,sequence)
+                VALUES(?,?,?,?,?) """
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.dataset_type}")
+            next_id = cur.fetchone()[0] + 1
+            rows = []
+            for segment in segments:
+                target_sentence_id = next_id
+                for i, sentence in enumerate(segment):
+                    rows.append((next_id, sentence, 1 if i == 0 else 0, None if i == 0 else target_sentence_id, i))
+                    next_id += 1
+            cur.executemany(sql, rows)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
     def get_segment(self, segment_id, max_segment_size=1000):
         sql = f""" SELECT * FROM {self.dataset_type}
                 WHERE id=? OR parent=? ORDER BY sequence ASC LIMIT ?"""
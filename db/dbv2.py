@@ -1,9 +1,10 @@
 from cached_property import cached_property
 import sqlite3
 from sqlite3 import Error
-from typing import List, Tuple, Protocol
+from typing import Iterable, List, Tuple, Protocol
 import math
 import os
+import time
 import numpy as np
 
 # change the execution path to filepath for relative db file import
@@ -13,6 +14,12 @@ os.chdir(dname)
 
 
 TRAIN_TEST_SPLIT = 0.75
+# rows written per transaction by import_segments
+IMPORT_BATCH_SIZE = 50000
+# page cache used while importing
+IMPORT_CACHE_KIB = 64 * 1024
+# rows read from the cursor at a time by iter_segments
+FETCH_SIZE = 1000
 
 
 class DB:
@@ -70,6 +77,20 @@ class DB:
         except Error as e:
             print(e)
 
+    def create_segment_indexes(self):
+        """Index the columns get_segment and get_target_sentences filter on.
+
+        Runs on every open, so tables created before the indexes get them too.
+        """
+        self.create_table(
+            f"""CREATE INDEX IF NOT EXISTS {self.table_name}_parent_sequence
+                ON {self.table_name} (parent, sequence)"""
+        )
+        self.create_table(
+            f"""CREATE INDEX IF NOT EXISTS {self.table_name}_target
+                ON {self.table_name} (target)"""
+        )
+
     def get_num_rows(self):
         sql = f"""SELECT COUNT(*) FROM {self.table_name}"""
         cur = self.conn.cursor()
@@ -99,7 +120,6 @@ class DB:
             cur = self.conn.cursor()
             # insert the target segment
             cur.execute(sql, (segment[0], 1, None, 0))
-            self.conn.commit()
             target_sentence_id = cur.lastrowid
 
         if len(segment) > 1:
@@ -108,10 +128,79 @@ class DB:
                 remaining_segment.append((sentence, 0, target_sentence_id, i + 1))
 
             cur.executemany(sql, remaining_segment)
-            self.conn.commit()
 
+        self.conn.commit()
         return target_sentence_id
 
+    def set_bulk_pragmas(self):
+        cur = self.conn.cursor()
+        # readers keep working during an import and commits do not wait for an fsync
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute(f"PRAGMA cache_size=-{IMPORT_CACHE_KIB}")
+
+    def import_segments(self, segments: Iterable[List[str]], batch_size=IMPORT_BATCH_SIZE) -> dict:
+        """Insert segments (lists of sentences) in transactions of about batch_size rows.
+
+        Ids are assigned here rather than read back per row, so every sentence
+        is inserted with its parent in one executemany. Each transaction takes
+        the write lock before reading the largest id, so several processes can
+        import into the same table. Returns the number of rows and segments
+        written and the rows per second.
+        """
+        # the pragmas cannot change the journal inside a transaction
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.set_bulk_pragmas()
+
+        start = time.perf_counter()
+        num_rows = 0
+        num_segments = 0
+        batch = []
+        batch_rows = 0
+        for segment in segments:
+            if len(segment) == 0:
+                continue
+            batch.append(segment)
+            batch_rows += len(segment)
+            if batch_rows >= batch_size:
+                self.insert_segments(batch)
+                num_rows += batch_rows
+                num_segments += len(batch)
+                batch = []
+                batch_rows = 0
+        if batch:
+            self.insert_segments(batch)
+            num_rows += batch_rows
+            num_segments += len(batch)
+
+        seconds = time.perf_counter() - start
+        rows_per_second = num_rows / seconds if seconds > 0 else 0.0
+        print(f"Imported {num_rows} rows ({num_segments} segments) into {self.table_name} at {rows_per_second:,.0f} rows/s")
+        return {"rows": num_rows, "segments": num_segments, "seconds": seconds, "rows_per_second": rows_per_second}
+
+    def insert_segments(self, segments: List[List[str]]):
+        """Insert segments in one transaction, numbering their sentences after the largest id."""
+        sql = f""" INSERT INTO {self.table_name}(id,sentence,target,parent,sequence)
+                VALUES(?,?,?,?,?) """
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.table_name}")
+            next_id = cur.fetchone()[0] + 1
+            rows = []
+            for segment in segments:
+                target_sentence_id = next_id
+                for i, sentence in enumerate(segment):
+                    rows.append((next_id, sentence, 1 if i == 0 else 0, None if i == 0 else target_sentence_id, i))
+                    next_id += 1
+            cur.executemany(sql, rows)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
     def insert_train_test_record(self, segment_id, type):
         sql = f""" INSERT INTO {self.table_name}_train_test(segment_id,type)
                 VALUES(?,?) """
@@ -146,34 +235,79 @@ class DB:
 
         return rows
 
-    def get_target_sentence_ids(self, split="test"):
+    def get_target_sentence_ids(self, split="test", num_sentences=None, seed=None):
+        """Return the train/test rows of the split in random order, num_sentences of them if given.
+
+        The rows are sampled in numpy instead of sorting the table with
+        ORDER BY RANDOM(), so the same seed gives the same sample.
+        """
         train_test_table_name = "wikisection_" + self.dataset_type + "_train_test"
-        sql = (
-            f"""SELECT * FROM {train_test_table_name} WHERE type=? ORDER BY RANDOM()"""
-        )
+        sql = f"""SELECT * FROM {train_test_table_name} WHERE type=? ORDER BY id ASC"""
 
         cur = self.conn.cursor()
         cur.execute(sql, (split,))
 
         rows = cur.fetchall()
+        if num_sentences is None or num_sentences > len(rows):
+            num_sentences = len(rows)
+        sample = np.random.default_rng(seed).choice(len(rows), size=num_sentences, replace=False)
 
-        return rows
+        return [rows[i] for i in sample]
+
+    def stage_segment_ids(self, segment_ids):
+        """Fill a temporary table with the segment ids and their position, to join against."""
+        cur = self.conn.cursor()
+        cur.execute(
+            """CREATE TEMP TABLE IF NOT EXISTS staged_segments (
+                    position integer PRIMARY KEY,
+                    segment_id integer NOT NULL
+                )"""
+        )
+        cur.execute("DELETE FROM staged_segments")
+        cur.executemany("INSERT INTO staged_segments(position,segment_id) VALUES(?,?)", enumerate(segment_ids))
+        return cur
+
+    def get_target_sentences_by_id(self, segment_ids):
+        """Return the rows of the segment ids in their order, with one query."""
+        cur = self.stage_segment_ids(segment_ids)
+        cur.execute(
+            f"""SELECT t.* FROM staged_segments s
+                JOIN {self.table_name} t ON t.id = s.segment_id
+                ORDER BY s.position"""
+        )
+        rows = cur.fetchall()
+        # ends the transaction the temp table writes opened
+        self.conn.commit()
 
-    def get_random_target_sentences(self, num_sentences, split="test"):
-        target_sentence_ids = self.get_target_sentence_ids(split)[:num_sentences]
-        sql = f"""SELECT * FROM {self.table_name} WHERE id=?"""
+        return rows
 
-        rows = []
-        for i in target_sentence_ids:
-            # the id of the segment is the second column
-            target_sentence_id = i[1]
-            cur = self.conn.cursor()
-            cur.execute(sql, (target_sentence_id,))
+    def get_segments(self, segment_ids, max_segment_size=1000):
+        """Return the segments starting at the segment ids, as get_segment does for one, with one query."""
+        cur = self.stage_segment_ids(segment_ids)
+        cur.execute(
+            f"""SELECT * FROM {self.table_name}
+                WHERE id IN (SELECT segment_id FROM staged_segments)
+                OR parent IN (SELECT segment_id FROM staged_segments)"""
+        )
+        staged = set(segment_ids)
+        members = {segment_id: [] for segment_id in staged}
+        for row in cur:
+            # id is the first column and parent the fourth
+            if row[0] in staged:
+                members[row[0]].append(row)
+            if row[3] in staged:
+                members[row[3]].append(row)
+        self.conn.commit()
 
-            row = cur.fetchall()
-            rows.append(*row)
+        for rows in members.values():
+            # sequence is the fifth column, sorting here is cheaper than ORDER BY
+            rows.sort(key=lambda row: row[4])
+        return [members[segment_id][:max_segment_size] for segment_id in segment_ids]
 
-        return rows
+    def get_random_target_sentences(self, num_sentences, split="test", seed=None):
+        target_sentence_ids = self.get_target_sentence_ids(split, num_sentences, seed)
+        # the id of the segment is the second column
+        return self.get_target_sentences_by_id([i[1] for i in target_sentence_ids])
 
     def get_random_segments(
         self,
@@ -181,35 +315,35 @@ class DB:
         split="test",
         max_segment_size=1000,
         artificial_segments=False,
+        seed=None,
     ):
-        target_sentences = self.get_random_target_sentences(num_segments, split)
+        target_sentence_ids = [i[1] for i in self.get_target_sentence_ids(split, num_segments, seed)]
+        if not artificial_segments:
+            return self.get_segments(target_sentence_ids, max_segment_size)
+
         segments = []
-        for sentence in target_sentences:
-            if not artificial_segments:
-                segments.append(self.get_segment(sentence[0], max_segment_size))
-            elif artificial_segments:
-                # most segments don't exceed 1000 sentences anyways
-                curr_segment = self.get_segment(sentence[0], 1000)
-                artificial_segment = []
-                for i, sentence in enumerate(curr_segment):
-                    if len(artificial_segment) == 0:
-                        # force the first label in the artificial segment to be 1
-                        # has to be converted to tuple first.
-                        sentence = list(sentence)
-                        sentence[2] = 1
-                        sentence = tuple(sentence)
-                    artificial_segment.append(sentence)
-                    if (i + 1) % max_segment_size == 0 or (i + 1) % len(
-                        curr_segment
-                    ) == 0:
-                        # append the accumulated segment and dump
-                        segments.append(artificial_segment)
-                        artificial_segment = []
+        # most segments don't exceed 1000 sentences anyways
+        for curr_segment in self.get_segments(target_sentence_ids, 1000):
+            artificial_segment = []
+            for i, sentence in enumerate(curr_segment):
+                if len(artificial_segment) == 0:
+                    # force the first label in the artificial segment to be 1
+                    # has to be converted to tuple first.
+                    sentence = list(sentence)
+                    sentence[2] = 1
+                    sentence = tuple(sentence)
+                artificial_segment.append(sentence)
+                if (i + 1) % max_segment_size == 0 or (i + 1) % len(
+                    curr_segment
+                ) == 0:
+                    # append the accumulated segment and dump
+                    segments.append(artificial_segment)
+                    artificial_segment = []
 
         return segments
 
     def get_random_segments_pct(
-        self, pct_data=1, split="test", max_segment_size=1000, artificial_segments=False
+        self, pct_data=1, split="test", max_segment_size=1000, artificial_segments=False, seed=None
     ):
         num_segments = self.get_num_segments()
         num_segments_to_fetch = math.floor(num_segments * pct_data)
@@ -218,6 +352,7 @@ class DB:
             split=split,
             max_segment_size=max_segment_size,
             artificial_segments=artificial_segments,
+            seed=seed,
         )
 
     def get_all(self):
@@ -231,19 +366,34 @@ class DB:
         return rows
 
     def get_all_segments(self):
-        sentences = self.get_all()
-        segments = []
+        return list(self.iter_segments())
 
-        new_segment = []
-        for sentence in sentences:
-            if sentence[2] == 1:
-                if len(new_segment) > 0:
-                    segments.append(new_segment)
-                    new_segment = []
-                new_segment.append(sentence)
-            else:
-                new_segment.append(sentence)
-        return segments
+    def iter_segments(self, columns=None, fetch_size=FETCH_SIZE):
+        """Yield the segments of the table in id order, reading fetch_size rows at a time.
+
+        Only one segment is held at a time. columns picks the columns of the
+        rows, e.g. ("sentence", "target"), all of them by default. A segment
+        starts at every row with target 1.
+        """
+        projection = "*" if columns is None else ",".join(columns)
+        # the target is read first to find the segment starts, then dropped
+        sql = f"""SELECT target, {projection} FROM {self.table_name} ORDER BY id ASC"""
+
+        cur = self.conn.cursor()
+        cur.execute(sql)
+
+        segment = []
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                if row[0] == 1 and len(segment) > 0:
+                    yield segment
+                    segment = []
+                segment.append(row[1:])
+        if len(segment) > 0:
+            yield segment
 
 
 class Table(DB):
@@ -260,6 +410,7 @@ class Table(DB):
         # create tables
         if self.conn is not None:
             self.create_table(sql_create_table)
+            self.create_segment_indexes()
 
 
 class AugmentedTable(DB):
@@ -389,6 +540,7 @@ class TestTable(DB):
         # create tables
         if self.conn is not None:
             self.create_table(sql_create_test_table)
+            self.create_segment_indexes()
 
 
 class ValidationTable(DB):
@@ -407,6 +559,7 @@ class ValidationTable(DB):
         # create tables
         if self.conn is not None:
             self.create_table(sql_create_validation_table)
+            self.create_segment_indexes()
 
 
 class TrainTestTable(DB):
@@ -425,6 +578,11 @@ class TrainTestTable(DB):
         # create tables
         if self.conn is not None:
             self.create_table(sql_create_train_test_table)
+            # covers the reads of a split in get_target_sentence_ids
+            self.create_table(
+                f"""CREATE INDEX IF NOT EXISTS {self.table_name}_type_segment_id
+                    ON {self.table_name} (type, segment_id)"""
+            )
 
     def create_train_test_split(self) -> None:
         sql_delete = f"""DELETE from {self.table_name}"""
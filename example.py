@@ -6,13 +6,7 @@ This script shows how to use the Determinor class to segment text
 into topics using different LLM models.
 """
 
-import os
-import sys
-
-# Add src directory to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
-
-from determinor import Determinor
+from src.determinor import Determinor
 
 def main():
     """Run example text segmentation."""
@@ -0,0 +1,206 @@
+from typing import Any, Iterator, List, Optional
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_community.embeddings.ollama import OllamaEmbeddings
+from langchain_community.llms.ollama import Ollama, OllamaEndpointNotFoundError
+from langchain_openai import ChatOpenAI
+
+# Load OpenAI API key from environment variable
+# You can set this in a .env file or as an environment variable
+# Example: OPENAI_API_KEY=your_actual_api_key_here
+if 'OPENAI_API_KEY' not in os.environ:
+    # Try to load from .env file
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass  # dotenv not installed, that's okay
+
+# keep-alive connections kept open per host, should cover the number of requests in flight
+POOL_SIZE = 16
+
+# shared by every Ollama client so requests reuse open connections instead of
+# doing a new TCP handshake per sentence
+ollama_session = requests.Session()
+ollama_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+ollama_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+
+openai_http_client = None
+
+# context window of Ollama models when num_ctx is not set
+OLLAMA_NUM_CTX = 2048
+# tokens a constrained verdict may generate, local models often emit a space or newline first
+VERDICT_TOKENS = 2
+# alternatives returned with the logprob of each generated token
+TOP_LOGPROBS = 5
+OPENAI_CONTEXT_LIMITS = {
+    "gpt-4o-mini": 128000,
+    "o1-mini": 128000,
+}
+
+
+class PooledOllama(Ollama):
+    """Ollama completion model sending its requests through the shared keep-alive session."""
+
+    def _create_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        elif self.stop is not None:
+            stop = self.stop
+
+        params = self._default_params
+        for key in self._default_params:
+            if key in kwargs:
+                params[key] = kwargs[key]
+
+        if "options" in kwargs:
+            params["options"] = kwargs["options"]
+        else:
+            params["options"] = {
+                **params["options"],
+                "stop": stop,
+                **{k: v for k, v in kwargs.items() if k not in self._default_params},
+            }
+
+        response = ollama_session.post(
+            url=api_url,
+            headers={
+                "Content-Type": "application/json",
+                **(self.headers if isinstance(self.headers, dict) else {}),
+            },
+            auth=self.auth,
+            json={"prompt": payload.get("prompt"), "images": payload.get("images", []), **params},
+            stream=True,
+            timeout=self.timeout,
+        )
+        response.encoding = "utf-8"
+        if response.status_code == 404:
+            raise OllamaEndpointNotFoundError(
+                "Ollama call failed with status code 404. "
+                f"Maybe your model is not found and you should pull the model with `ollama pull {self.model}`."
+            )
+        elif response.status_code != 200:
+            raise ValueError(f"Ollama call failed with status code {response.status_code}. Details: {response.text}")
+        try:
+            yield from response.iter_lines(decode_unicode=True)
+        finally:
+            # a fully read response goes back to the pool, a stream closed early
+            # drops its connection, which makes Ollama stop generating
+            response.close()
+
+
+class PooledOllamaEmbeddings(OllamaEmbeddings):
+    """Ollama embeddings sending a whole batch of texts in one /api/embed request.
+
+    The base class posts one /api/embeddings request per text on a new
+    connection. /api/embed returns unit-length vectors, so they are cached
+    under their own model id rather than mixed with the older ones.
+    """
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.model}/api/embed"
+
+    def _embed(self, input: List[str]) -> List[List[float]]:
+        if not input:
+            return []
+        response = ollama_session.post(
+            f"{self.base_url}/api/embed",
+            headers={"Content-Type": "application/json", **(self.headers or {})},
+            json={"model": self.model, "input": input, "options": self._default_params["options"]},
+        )
+        if response.status_code != 200:
+            raise ValueError(f"Ollama embed call failed with status code {response.status_code}. Details: {response.text}")
+        return response.json()["embeddings"]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one request, embed_query only takes one."""
+        return self._embed([f"{self.query_instruction}{text}" for text in texts])
+
+
+def get_openai_http_client():
+    global openai_http_client
+    if openai_http_client is None:
+        limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+        openai_http_client = httpx.Client(limits=limits)
+    return openai_http_client
+
+
+BACKENDS = {
+    "mistral": lambda: PooledOllama(model="mistral"),
+    "deepseek": lambda: PooledOllama(model="deepseek-r1:8b"),
+    "openai_4o": lambda: ChatOpenAI(model="gpt-4o-mini", http_client=get_openai_http_client()),
+    "openai_o1": lambda: ChatOpenAI(model="o1-mini", temperature=1, http_client=get_openai_http_client()),
+}
+
+models = {}
+models_lock = threading.Lock()
+
+
+def register_backend(name: str, factory):
+    """Register a function building the model client for a backend name.
+
+    Registering an existing name replaces it and drops its client.
+    """
+    with models_lock:
+        BACKENDS[name] = factory
+        models.pop(name, None)
+
+
+def get_model(name: str = "mistral"):
+    """Return the client of a backend, built on first use and shared afterwards."""
+    with models_lock:
+        if name not in models:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown backend '{name}'. Registered backends: {', '.join(BACKENDS)}")
+            models[name] = BACKENDS[name]()
+        return models[name]
+
+
+def get_context_limit(model):
+    """Return the number of tokens a model accepts, or None when unknown."""
+    if isinstance(model, Ollama):
+        return model.num_ctx or OLLAMA_NUM_CTX
+    if isinstance(model, ChatOpenAI):
+        return OPENAI_CONTEXT_LIMITS.get(model.model_name)
+    return getattr(model, "context_limit", None)
+
+
+def get_verdict_token_ids(model_name: str) -> list[int]:
+    """Return the ids of the single-token spellings of True and False, if the tokenizer is available."""
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(model_name)
+    except Exception:
+        return []
+    token_ids = [encoding.encode(text) for text in ["True", "False", " True", " False"]]
+    return [ids[0] for ids in token_ids if len(ids) == 1]
+
+
+def get_verdict_model(model):
+    """Bind a model to answer True/False in as few tokens as the backend allows.
+
+    OpenAI chat models generate a single token biased towards True/False and
+    return its logprobs, Ollama models stop after VERDICT_TOKENS tokens.
+    Models that support neither (e.g. o1) are returned unchanged.
+    """
+    if isinstance(model, ChatOpenAI):
+        if model.model_name.startswith("o1"):
+            return model
+        # the same bias on both answers leaves their relative probabilities untouched
+        logit_bias = {token_id: 100 for token_id in get_verdict_token_ids(model.model_name)}
+        return model.bind(max_tokens=1, logprobs=True, top_logprobs=TOP_LOGPROBS, logit_bias=logit_bias or None)
+    if isinstance(model, Ollama):
+        return model.bind(num_predict=VERDICT_TOKENS)
+    return model
@@ -0,0 +1,77 @@
+from collections import deque
+
+from .tokens import count_tokens
+
+
+class ContextWindow:
+    """Rolling window over the last sentences of the current paragraph.
+
+    Holds at most max_sentences sentences and, when max_tokens is set, at most
+    max_tokens tokens (the latest sentence is always kept). The newline-joined
+    text of the window is updated as sentences come and go, so neither the
+    memory nor the work per sentence grows with the length of the paragraph.
+    """
+
+    def __init__(self, max_sentences: int, max_tokens: int = None, token_counter=count_tokens):
+        self.max_sentences = max_sentences
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.sentences = deque()
+        self.token_counts = deque()
+        self.num_tokens = 0
+        self.text = ""
+
+    def append(self, sentence: str):
+        self.sentences.append(sentence)
+        self.text = self.text + "\n" + sentence if len(self.sentences) > 1 else sentence
+        self.token_counts.append(self.token_counter(sentence))
+        self.num_tokens += self.token_counts[-1]
+
+        while len(self.sentences) > 1 and (
+            len(self.sentences) > self.max_sentences
+            or (self.max_tokens is not None and self.num_tokens > self.max_tokens)
+        ):
+            evicted = self.sentences.popleft()
+            self.text = self.text[len(evicted) + 1:]
+            self.num_tokens -= self.token_counts.popleft()
+
+    def tail_text(self, max_tokens: int) -> str:
+        """Join the latest sentences that fit in max_tokens tokens.
+
+        Every sentence is counted with one extra token for the newline joining it.
+        """
+        if self.num_tokens + len(self.sentences) <= max_tokens:
+            return self.text
+        num_tokens = 0
+        num_sentences = 0
+        for token_count in reversed(self.token_counts):
+            if num_tokens + token_count + 1 > max_tokens:
+                break
+            num_tokens += token_count + 1
+            num_sentences += 1
+        if num_sentences == 0:
+            return ""
+        return "\n".join(list(self.sentences)[-num_sentences:])
+
+    def reset(self, sentence: str = None):
+        """Empty the window, optionally starting it again with sentence."""
+        self.sentences.clear()
+        self.token_counts.clear()
+        self.num_tokens = 0
+        self.text = ""
+        if sentence is not None:
+            self.append(sentence)
+
+    def copy(self):
+        window = ContextWindow(self.max_sentences, self.max_tokens, self.token_counter)
+        window.sentences = self.sentences.copy()
+        window.token_counts = self.token_counts.copy()
+        window.num_tokens = self.num_tokens
+        window.text = self.text
+        return window
+
+    def __iter__(self):
+        return iter(self.sentences)
+
+    def __len__(self):
+        return len(self.sentences)
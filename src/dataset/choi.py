@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+import os
+
+import numpy as np
+from langchain.schema.document import Document
+
+# line between two segments of a .ref file
+SEPARATOR = "=========="
+# characters per chunk, most Choi segments fit in one chunk. A longer
+# sentence makes up a chunk on its own
+CHUNK_SIZE = 1600
+
+
+@dataclass
+class RefDocument:
+    """A .ref document as one text buffer instead of a list of sentences.
+
+    Sentence i is text[offsets[i]:offsets[i + 1] - 1], sentences are joined
+    by newlines. Bit i of the packed boundaries bitmap is set when sentence i
+    starts a segment.
+    """
+
+    source: str
+    text: str
+    offsets: np.ndarray
+    boundaries: np.ndarray
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sentence(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1] - 1]
+
+    @property
+    def sentences(self) -> list[str]:
+        return self.text.split("\n") if len(self) else []
+
+    @property
+    def labels(self) -> np.ndarray:
+        """1 for the sentences starting a segment, 0 for the others, as in the target column of the db tables."""
+        return np.unpackbits(self.boundaries, count=len(self))
+
+    def segments(self) -> list[list[str]]:
+        sentences = self.sentences
+        starts = np.flatnonzero(self.labels).tolist() + [len(sentences)]
+        return [sentences[start:end] for start, end in zip(starts, starts[1:])]
+
+
+def parse_ref_document(text: str, source: str = None) -> RefDocument:
+    sentences = []
+    starts_segment = []
+    new_segment = True
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(SEPARATOR):
+            new_segment = True
+        elif line:
+            sentences.append(line)
+            starts_segment.append(new_segment)
+            new_segment = False
+    offsets = np.zeros(len(sentences) + 1, dtype=np.int64)
+    # every sentence is followed by a newline, except the last which is followed by the end
+    np.cumsum(np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences)) + 1, out=offsets[1:])
+    offsets = offsets.astype(np.int32) if offsets[-1] < np.iinfo(np.int32).max else offsets
+    return RefDocument(source, "\n".join(sentences), offsets, np.packbits(np.array(starts_segment, dtype=bool)))
+
+
+def parse_ref(text: str) -> list[list[str]]:
+    """Split the text of a .ref file into its segments, each a list of sentences."""
+    return parse_ref_document(text).segments()
+
+
+def read_ref(path: str) -> RefDocument:
+    with open(path, "rb") as f:
+        text = f.read().decode("utf-8")
+    return parse_ref_document(text, source=path)
+
+
+def iter_ref_documents(data_path: str):
+    """Yield the .ref files under data_path, e.g. data/choi or data/choi/1/3-11, in a stable order."""
+    for root, dirs, files in os.walk(data_path):
+        # numeric directory and file names sort as numbers
+        dirs.sort(key=natural_key)
+        for name in sorted(files, key=natural_key):
+            if name.endswith(".ref"):
+                yield read_ref(os.path.join(root, name))
+
+
+def natural_key(name: str):
+    stem = name.split(".")[0]
+    return (0, int(stem), name) if stem.isdigit() else (1, 0, name)
+
+
+class RefSplitter:
+    """Splits Choi .ref documents into chunks of whole sentences within one segment.
+
+    Chunks never straddle a ==========-separator and do not overlap, so
+    every sentence is embedded exactly once. Each chunk's metadata holds its
+    segment and the index of its first sentence in the document.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def split_documents(self, documents: list[Document]) -> list[Document]:
+        chunks = []
+        for document in documents:
+            sentence_index = 0
+            for segment_id, sentences in enumerate(parse_ref(document.page_content)):
+                for start, end in self.group(sentences):
+                    chunks.append(
+                        Document(
+                            page_content="\n".join(sentences[start:end]),
+                            metadata={
+                                **document.metadata,
+                                "segment": segment_id,
+                                "start_sentence": sentence_index + start,
+                                "num_sentences": end - start,
+                            },
+                        )
+                    )
+                sentence_index += len(sentences)
+        return chunks
+
+    def group(self, sentences: list[str]):
+        """Yield (start, end) ranges of consecutive sentences that fit in chunk_size characters."""
+        start = 0
+        length = 0
+        for i, sentence in enumerate(sentences):
+            # one newline joins each sentence to the previous one
+            added = len(sentence) + (1 if i > start else 0)
+            if i > start and length + added > self.chunk_size:
+                yield start, i
+                start, length = i, len(sentence)
+            else:
+                length += added
+        if start < len(sentences):
+            yield start, len(sentences)
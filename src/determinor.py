@@ -1,20 +1,31 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms.ollama import Ollama
-from langchain_openai import ChatOpenAI
-import os
-
-# Load OpenAI API key from environment variable
-# You can set this in a .env file or as an environment variable
-# Example: OPENAI_API_KEY=your_actual_api_key_here
-if 'OPENAI_API_KEY' not in os.environ:
-    # Try to load from .env file
-    try:
-        from dotenv import load_dotenv
-        load_dotenv()
-    except ImportError:
-        pass  # dotenv not installed, that's okay
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import copy
+import json
+import math
+import re
+import threading
+import time
+
+import numpy as np
+
+from .backends import get_context_limit, get_model, get_verdict_model
+from .context import ContextWindow
+from .get_embedding_function import get_cached_embedding_function
+from .prompt_template import CompiledPrompt
+from .tokens import TokenCounter
 
 MAX_CONTEXT_WINDOW = 5
+# number of documents segmented at once by query_batch_documents
+MAX_WORKERS = 4
+# number of sentences queried in parallel by the speculative mode, 1 disables it
+SPECULATION_WIDTH = 1
+# number of sentences asked about in a single prompt by the batched mode, 1 disables it
+BATCH_SIZE = 1
+# tokens of the backend context limit kept free for the answer
+RESPONSE_TOKENS = 32
+# probability of "True" above which a constrained verdict continues the paragraph
+CONFIDENCE_THRESHOLD = 0.5
 
 QUERY_PROMPT = """
 Given the following paragraph:
@@ -40,23 +51,269 @@ Does the following sentence continue the same dialogue?
 If it does, output "True". If they are not, output "False". Do not provide any explanation. Ensure your answer is limited to "True" or "False".
 """
 
+BATCH_QUERY_PROMPT = """
+Given the following paragraph:
+
+{prev_paragraph}
+
+The following numbered sentences come after the paragraph, in order:
+
+{sentences}
+
+A sentence starts a new topic if it does not continue the paragraph formed by the text before it. Output the numbers of the sentences that start a new topic as a comma separated list, for example "Boundaries: 2, 5". If every sentence continues the paragraph, output "Boundaries: none". Do not provide any explanation.
+"""
+
+BATCH_MEETING_PROMPT = """
+Given the following meeting transcript:
+
+{prev_paragraph}
+
+The following numbered sentences come after the transcript, in order:
+
+{sentences}
+
+A sentence starts a new dialogue if it does not continue the dialogue formed by the text before it. Output the numbers of the sentences that start a new dialogue as a comma separated list, for example "Boundaries: 2, 5". If every sentence continues the dialogue, output "Boundaries: none". Do not provide any explanation.
+"""
+
+# reasoning models such as deepseek-r1 think out loud before answering
+THINK_START = "<think>"
+THINK_END = "</think>"
+
+BOUNDARIES_PATTERN = re.compile(r"boundaries:\s*(none|\d+(?:\s*,\s*\d+)*)\.?")
+
+
+def parse_boundaries(response_text: str, num_sentences: int):
+    """Parse the 1-based boundary positions of a batched prompt response.
+
+    Returns None when the response is not exactly in the requested format or
+    refers to a sentence outside the window.
+    """
+    match = BOUNDARIES_PATTERN.fullmatch(response_text.lower().strip())
+    if match is None:
+        return None
+    if match.group(1) == "none":
+        return set()
+    positions = [int(p) for p in match.group(1).split(",")]
+    if len(set(positions)) != len(positions) or not all(1 <= p <= num_sentences for p in positions):
+        return None
+    return set(positions)
+
+
+def find_verdict(response_text: str):
+    """Return the answer part of a partial response once it says "True" or "False".
+
+    Returns None while the answer is not decidable yet, including while a
+    reasoning model is still inside its <think> block.
+    """
+    if THINK_START in response_text:
+        if THINK_END not in response_text:
+            return None
+        response_text = response_text.split(THINK_END, 1)[1]
+    formatted_output = response_text.lower()
+    if "true" in formatted_output or "false" in formatted_output:
+        return response_text
+    return None
+
+
+def verdict_confidence(response):
+    """Return P(True) among the True/False alternatives of the first generated token, or None without logprobs."""
+    logprobs = (getattr(response, "response_metadata", None) or {}).get("logprobs") or {}
+    content = logprobs.get("content")
+    if not content:
+        return None
+    p_true = p_false = 0.0
+    for candidate in content[0].get("top_logprobs") or [content[0]]:
+        token = candidate["token"].strip().lower()
+        if token == "true":
+            p_true += math.exp(candidate["logprob"])
+        elif token == "false":
+            p_false += math.exp(candidate["logprob"])
+    if p_true + p_false == 0:
+        return None
+    return p_true / (p_true + p_false)
+
+
+def apply_threshold(confidences: list[float], threshold: float) -> list[bool]:
+    """Re-decide constrained verdicts at another threshold without querying the model again.
+
+    Only approximates a new run: a different verdict would also have changed
+    the context of the sentences after it.
+    """
+    return [confidence is not None and confidence >= threshold for confidence in confidences]
+
+
+@dataclass
+class QueryStats:
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    decisions: int = 0
+    # batched responses that could not be parsed and were asked again per sentence
+    fallbacks: int = 0
+    prompt_token_counts: list = field(default_factory=list, repr=False)
+    # streamed calls stopped as soon as the verdict was decidable
+    early_exits: int = 0
+    verdict_seconds: list = field(default_factory=list, repr=False)
+    # sentences decided by the embedding prefilter without asking the model
+    prefiltered: int = 0
+    escalated: int = 0
+    # calls that waited for the whole completion
+    full_response_seconds: list = field(default_factory=list, repr=False)
+    # speculative calls made after a boundary in their window, sent and then thrown away
+    mispredicted: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record_call(self, prompt_tokens: int, completion_tokens: int):
+        with self.lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.prompt_token_counts.append(prompt_tokens)
+
+    def record_full_response(self, seconds: float):
+        with self.lock:
+            self.full_response_seconds.append(seconds)
+
+    def record_early_exit(self, seconds: float):
+        with self.lock:
+            self.early_exits += 1
+            self.verdict_seconds.append(seconds)
+
+    def seconds_saved_per_call(self, full_response_seconds: float = None):
+        """Estimate the time an early exit saves compared to waiting for the whole completion.
+
+        The cancelled part of a completion cannot be timed, so the mean latency
+        of the full completions seen in this run, or full_response_seconds
+        measured in a non-streaming run, stands in for it.
+        """
+        if full_response_seconds is None and self.full_response_seconds:
+            full_response_seconds = sum(self.full_response_seconds) / len(self.full_response_seconds)
+        if full_response_seconds is None or not self.verdict_seconds:
+            return None
+        return full_response_seconds - sum(self.verdict_seconds) / len(self.verdict_seconds)
+
+    def record_prefilter(self, escalated: bool):
+        with self.lock:
+            if escalated:
+                self.escalated += 1
+            else:
+                self.prefiltered += 1
+
+    @property
+    def escalated_fraction(self) -> float:
+        """Fraction of the prefiltered sentences that still needed the model."""
+        total = self.prefiltered + self.escalated
+        return self.escalated / total if total else 0.0
+
+    def record_decision(self):
+        with self.lock:
+            self.decisions += 1
+
+    def record_fallback(self):
+        with self.lock:
+            self.fallbacks += 1
+
+    def record_mispredicted(self, num_calls: int):
+        with self.lock:
+            self.mispredicted += num_calls
+
+    @property
+    def tokens_per_decision(self) -> float:
+        if self.decisions == 0:
+            return 0.0
+        return (self.prompt_tokens + self.completion_tokens) / self.decisions
+
+    def prompt_token_distribution(self) -> dict:
+        """Summarize the prompt sizes sent to the model during the run."""
+        counts = sorted(self.prompt_token_counts)
+        if not counts:
+            return {}
+        percentile = lambda p: counts[min(len(counts) - 1, int(p * len(counts)))]
+        return {
+            "min": counts[0],
+            "mean": sum(counts) / len(counts),
+            "p50": percentile(0.5),
+            "p90": percentile(0.9),
+            "p99": percentile(0.99),
+            "max": counts[-1],
+        }
+
 
 class Determinor:
-    def __init__(self, deepseek=False, openai_4o=False, openai_o1=False, meeting_dataset=False, max_context_window=MAX_CONTEXT_WINDOW):
+    def __init__(self, deepseek=False, openai_4o=False, openai_o1=False, meeting_dataset=False, max_context_window=MAX_CONTEXT_WINDOW, model=None, max_workers=MAX_WORKERS, speculation_width=SPECULATION_WIDTH, cache=None, batch_size=BATCH_SIZE, backend=None, max_context_tokens=None, max_prompt_tokens=None, stream=False, constrained=False, confidence_threshold=CONFIDENCE_THRESHOLD, similarity_thresholds=None, embedding_function=None):
         self.openai_4o = openai_4o
         self.openai_o1 = openai_o1
-        if openai_4o:
-            self.model = ChatOpenAI(model="gpt-4o-mini")
-        elif openai_o1:
-            self.model = ChatOpenAI(model="o1-mini", temperature=1)
-        elif deepseek:
-            self.model = Ollama(model="deepseek-r1:8b")
+        self.cache = cache
+        if backend is None:
+            if openai_4o:
+                backend = "openai_4o"
+            elif openai_o1:
+                backend = "openai_o1"
+            elif deepseek:
+                backend = "deepseek"
+            else:
+                backend = "mistral"
+        self.backend = backend
+        if model is not None:
+            # any object with an invoke(prompt) method, e.g. a fake model in tests
+            self.model = model
         else:
-            self.model = Ollama(model="mistral")
-        self.prev_paragraph = []
+            # clients are shared between determinors, see backends.register_backend
+            self.model = get_model(backend)
+        self.verdict_model = get_verdict_model(self.model) if constrained else None
+        # (low, high) cosine similarities between a sentence and its context:
+        # at or above high it continues the paragraph, at or below low it starts
+        # a new one, and only the sentences in between are sent to the model.
+        # Applies to sentences queried one at a time, not to the speculative or
+        # batched prompt modes.
+        self.similarity_thresholds = similarity_thresholds
+        if similarity_thresholds is not None and embedding_function is None:
+            embedding_function = get_cached_embedding_function()
+        self.embedding_function = embedding_function
+        self.sentence_embeddings = {}
         self.max_context_window = max_context_window
+        # context window budget in tokens, on top of the max_context_window sentences
+        self.max_context_tokens = max_context_tokens
+        self.token_counter = TokenCounter(self.model_id)
+        if max_prompt_tokens is None:
+            context_limit = get_context_limit(self.model)
+            max_prompt_tokens = context_limit - RESPONSE_TOKENS if context_limit is not None else None
+        self.max_prompt_tokens = max_prompt_tokens
+        self.prev_paragraph = self.new_context()
+        # P(True) of each decision when it is known, aligned with the predictions
+        self.confidences = []
         self.meeting_dataset = meeting_dataset
-        
+        # parsed once here instead of building a ChatPromptTemplate per sentence
+        self.query_template = CompiledPrompt(MEETING_PROMPT if meeting_dataset else QUERY_PROMPT)
+        self.batch_query_template = CompiledPrompt(BATCH_MEETING_PROMPT if meeting_dataset else BATCH_QUERY_PROMPT)
+        self.query_template_tokens = self.token_counter.count(self.query_template.format_string)
+        self.batch_query_template_tokens = self.token_counter.count(self.batch_query_template.format_string)
+        self.max_workers = max_workers
+        self.speculation_width = speculation_width
+        self.batch_size = batch_size
+        # stream the True/False answers and stop generating once the verdict is known
+        self.stream = stream
+        # answer with a single True/False token and read the verdict from its logprobs
+        self.constrained = constrained
+        self.confidence_threshold = confidence_threshold
+        # shared with forks so concurrent documents add up to a single run
+        self.stats = QueryStats()
+
+    def fork(self):
+        """Return a copy sharing the model but with an empty previous paragraph."""
+        determinor = copy.copy(self)
+        determinor.prev_paragraph = determinor.new_context()
+        determinor.confidences = []
+        determinor.sentence_embeddings = {}
+        return determinor
+
+    def new_context(self) -> ContextWindow:
+        return ContextWindow(self.max_context_window, self.max_context_tokens, self.token_counter)
+
+    @property
+    def model_id(self) -> str:
+        return getattr(self.model, "model_name", None) or getattr(self.model, "model", None) or type(self.model).__name__
+
     def query_data(self, sentence_1: str, sentence_2: str):
         assert sentence_1 is not None, "Sentence 1 is required."
         assert sentence_2 is not None, "Sentence 2 is required."
@@ -65,37 +322,239 @@ class Determinor:
     def query_batch_data(self, sentences: list[str]) -> list[bool]:
         assert sentences is not None, "Sentences are required."
         assert len(sentences) > 0, "Sentences are required."
+        if self.batch_size > 1:
+            return self.query_batched(sentences)
+        if self.speculation_width > 1:
+            return self.query_speculative(sentences)
+        # only the sequential path consults the prefilter
+        if self.similarity_thresholds is not None:
+            self.embed_sentences(sentences)
         predictions = []
         for sentence in sentences:
             predictions.append(self.query(sentence))
         return predictions
-    
-    def get_response(self, response):
-        if self.openai_4o or self.openai_o1:
-            return response.content
+
+    def embed_sentences(self, sentences: list[str]):
+        """Embed the sentences of a document in one batch for the prefilter."""
+        new_sentences = list(dict.fromkeys(s for s in sentences if s not in self.sentence_embeddings))
+        if not new_sentences:
+            return
+        embeddings = np.asarray(self.embedding_function.embed_documents(new_sentences), dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        self.sentence_embeddings.update(zip(new_sentences, embeddings))
+
+    def prefilter(self, sentence: str):
+        """Decide clearly similar or dissimilar sentences locally.
+
+        Returns "True" or "False" like the model would, or None when the
+        similarity falls between the thresholds (or there is no context yet)
+        and the model has to decide.
+        """
+        if self.similarity_thresholds is None or sentence not in self.sentence_embeddings:
+            return None
+        context = [self.sentence_embeddings[s] for s in self.prev_paragraph if s in self.sentence_embeddings]
+        if not context:
+            return None
+        context_embedding = np.mean(context, axis=0)
+        similarity = float(self.sentence_embeddings[sentence] @ context_embedding / max(np.linalg.norm(context_embedding), 1e-12))
+
+        low, high = self.similarity_thresholds
+        if similarity >= high:
+            verdict = "True"
+        elif similarity <= low:
+            verdict = "False"
         else:
-            return response
+            verdict = None
+        self.stats.record_prefilter(escalated=verdict is None)
+        return verdict
+
+    def query_speculative(self, sentences: list[str]) -> list[bool]:
+        """Query the next speculation_width sentences in parallel.
+
+        The prompts are built assuming every sentence in the window continues the
+        paragraph. Results are kept up to and including the first boundary, the
+        prompts after it were built on the wrong paragraph and are re-issued in
+        the next window. Predictions are the same as the sequential path, but
+        the whole window is already running by then, so every boundary costs
+        up to speculation_width - 1 extra calls, counted in stats.mispredicted.
+        """
+        predictions = []
+        i = 0
+        with ThreadPoolExecutor(max_workers=self.speculation_width) as executor:
+            while i < len(sentences):
+                window = sentences[i:i + self.speculation_width]
+                paragraph = self.prev_paragraph.copy()
+                futures = []
+                for sentence in window:
+                    futures.append(executor.submit(self.invoke_verdict, self.build_prompt(paragraph, sentence)))
+                    paragraph.append(sentence)
+
+                for decided, (sentence, future) in enumerate(zip(window, futures), 1):
+                    response_text, confidence = future.result()
+                    predictions.append(self.update_paragraph(sentence, response_text, confidence))
+                    i += 1
+                    if self.is_boundary(response_text):
+                        break
+                self.stats.record_mispredicted(len(window) - decided)
+        return predictions
+
+    def query_batched(self, sentences: list[str]) -> list[bool]:
+        """Ask for all the boundaries of batch_size sentences in a single prompt.
+
+        A response that cannot be parsed falls back to querying the sentences
+        of that window one at a time.
+        """
+        predictions = []
+        for i in range(0, len(sentences), self.batch_size):
+            window = sentences[i:i + self.batch_size]
+            prompt = self.build_batch_prompt(self.prev_paragraph, window)
+            boundaries = parse_boundaries(self.invoke(prompt, self.batch_query_template.template), len(window))
+
+            if boundaries is None:
+                self.stats.record_fallback()
+                for sentence in window:
+                    predictions.append(self.query(sentence))
+                continue
+
+            for position, sentence in enumerate(window, start=1):
+                predictions.append(self.update_paragraph(sentence, "False" if position in boundaries else "True"))
+        return predictions
+
+    def query_batch_documents(self, documents: list[list[str]]) -> list[list[bool]]:
+        """Segment independent documents concurrently.
+
+        Each document is queried sequentially on its own fork of this determinor,
+        so it starts from an empty previous paragraph. At most max_workers
+        documents are in flight at once and the predictions are returned in the
+        same order as the documents. The confidences of the forks are appended
+        to this determinor's confidences in document order, so they line up
+        with the concatenated predictions.
+        """
+        assert documents is not None, "Documents are required."
+        assert len(documents) > 0, "Documents are required."
+        forks = [self.fork() for _ in documents]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            predictions = list(executor.map(lambda fork, sentences: fork.query_batch_data(sentences), forks, documents))
+        for fork in forks:
+            self.confidences.extend(fork.confidences)
+        return predictions
+
+    def get_response(self, response):
+        # chat models return a message, completion models return the text itself
+        return getattr(response, "content", response)
     
-    def query(self, sentence):
-        PROMPT = MEETING_PROMPT if self.meeting_dataset else QUERY_PROMPT
-        prompt_template = ChatPromptTemplate.from_template(PROMPT)
-        # get last self.max_context_window sentences and join them with newlines
-        prev_paragraph_str = "\n".join(self.prev_paragraph[-self.max_context_window:])
-        
-        prompt = prompt_template.format(prev_paragraph=prev_paragraph_str, sentence=sentence)
+    @property
+    def prompt(self) -> str:
+        return self.query_template.template
+
+    def pack_context(self, prev_paragraph: ContextWindow, reserved_tokens: int) -> str:
+        """Return the context text, dropping its oldest sentences if the prompt would not fit the backend."""
+        if self.max_prompt_tokens is None:
+            return prev_paragraph.text
+        return prev_paragraph.tail_text(self.max_prompt_tokens - reserved_tokens)
+
+    def build_prompt(self, prev_paragraph: ContextWindow, sentence: str) -> str:
+        # the window keeps the last self.max_context_window sentences joined with newlines
+        prev_paragraph_str = self.pack_context(prev_paragraph, self.query_template_tokens + self.token_counter(sentence))
+
+        return self.query_template.format(prev_paragraph=prev_paragraph_str, sentence=sentence)
+
+    def build_batch_prompt(self, prev_paragraph: ContextWindow, sentences: list[str]) -> str:
+        sentences_str = "\n".join(f"{i}. {sentence}" for i, sentence in enumerate(sentences, start=1))
+        prev_paragraph_str = self.pack_context(prev_paragraph, self.batch_query_template_tokens + self.token_counter.count(sentences_str))
+
+        return self.batch_query_template.format(prev_paragraph=prev_paragraph_str, sentences=sentences_str)
 
-        response_text = self.model.invoke(prompt)
-        response_text = self.get_response(response_text)
+    def invoke(self, prompt: str, template: str = None, decoding: str = None) -> str:
+        if self.cache is not None:
+            key = self.cache.key(self.model_id, getattr(self.model, "temperature", None), template or self.prompt, prompt, decoding)
+            response_text = self.cache.get(key)
+            if response_text is not None:
+                return response_text
 
+        if decoding == "stream":
+            response_text = completion_text = self.stream_verdict(prompt)
+        elif decoding == "constrained":
+            completion_text, confidence = self.constrained_verdict(prompt)
+            response_text = json.dumps({"response": completion_text, "confidence": confidence})
+        else:
+            start = time.perf_counter()
+            response_text = completion_text = self.get_response(self.model.invoke(prompt))
+            self.stats.record_full_response(time.perf_counter() - start)
+        self.stats.record_call(self.token_counter.count(prompt), self.token_counter.count(completion_text))
+        if self.cache is not None:
+            self.cache.put(key, response_text)
+        return response_text
+
+    def invoke_verdict(self, prompt: str) -> tuple[str, float]:
+        """Ask a True/False question about a single sentence.
+
+        Returns the response and, for constrained decoding on backends with
+        logprobs, the probability that the sentence continues the paragraph.
+        """
+        if not self.constrained:
+            return self.invoke(prompt, decoding="stream" if self.stream else None), None
+
+        verdict = json.loads(self.invoke(prompt, decoding="constrained"))
+        confidence = verdict["confidence"]
+        if confidence is None:
+            return verdict["response"], None
+        return ("True" if confidence >= self.confidence_threshold else "False"), confidence
+
+    def constrained_verdict(self, prompt: str) -> tuple[str, float]:
+        """Generate at most a couple of tokens and read P(True) from their logprobs."""
+        start = time.perf_counter()
+        response = self.verdict_model.invoke(prompt)
+        response_text = self.get_response(response)
+        confidence = verdict_confidence(response)
+        if confidence is None and find_verdict(response_text) is None:
+            # too few tokens for this model to answer, e.g. a reasoning model cut off mid-thought
+            response_text = self.get_response(self.model.invoke(prompt))
+        self.stats.record_full_response(time.perf_counter() - start)
+        return response_text, confidence
+
+    def stream_verdict(self, prompt: str) -> str:
+        """Stream the response and cancel the generation as soon as the verdict is decidable."""
+        start = time.perf_counter()
+        chunks = self.model.stream(prompt)
+        response_text = ""
+        try:
+            for chunk in chunks:
+                response_text += self.get_response(chunk)
+                verdict = find_verdict(response_text)
+                if verdict is not None:
+                    self.stats.record_early_exit(time.perf_counter() - start)
+                    return verdict
+        finally:
+            # closing the stream early stops the generation on the backend
+            chunks.close()
+        self.stats.record_full_response(time.perf_counter() - start)
+        return response_text
+
+    def is_boundary(self, response_text: str) -> bool:
+        return "false" in response_text.lower().strip()
+
+    def update_paragraph(self, sentence: str, response_text: str, confidence: float = None) -> bool:
         formatted_output = response_text.lower().strip()
         print("." if "true" in formatted_output else "|", end="")
+        self.stats.record_decision()
+        self.confidences.append(confidence)
 
-        if "false" in formatted_output:
+        if self.is_boundary(response_text):
             # dump the entire previous paragraph and start a new one with the current sentence
-            self.prev_paragraph = [sentence]
+            self.prev_paragraph.reset(sentence)
         else:
             self.prev_paragraph.append(sentence)
         return True if "true" in formatted_output else False
+
+    def query(self, sentence):
+        verdict = self.prefilter(sentence)
+        if verdict is not None:
+            return self.update_paragraph(sentence, verdict)
+
+        prompt = self.build_prompt(self.prev_paragraph, sentence)
+        response_text, confidence = self.invoke_verdict(prompt)
+        return self.update_paragraph(sentence, response_text, confidence)
     
     def format_predictions(self, predictions: list[str]) -> list[int]:
         predictions = [p.lower().strip() for p in predictions]
@@ -0,0 +1,190 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_STORE_PATH = "embeddings"
+# texts sent to the embedding model per call
+EMBEDDING_BATCH_SIZE = 64
+# bound parameters per SELECT, below SQLite's limit
+MAX_QUERY_PARAMS = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """On-disk float32 vectors keyed by (model id, text hash).
+
+    The vectors of each model are appended to one flat float32 file that is
+    read through a memory map, and a SQLite index maps every key to its row.
+    Rows are allocated inside a write transaction, so several processes can
+    share a store.
+    """
+
+    def __init__(self, path=EMBEDDING_STORE_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.vectors = {}
+        self.conn = sqlite3.connect(os.path.join(path, "index.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """ CREATE TABLE IF NOT EXISTS models (
+                    model text PRIMARY KEY,
+                    file text NOT NULL,
+                    dim integer NOT NULL
+                ); """
+        )
+        self.conn.execute(
+            """ CREATE TABLE IF NOT EXISTS vectors (
+                    model text NOT NULL,
+                    text_hash text NOT NULL,
+                    row integer NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                ) WITHOUT ROWID; """
+        )
+
+    def model_file(self, model_id):
+        row = self.conn.execute("SELECT file, dim FROM models WHERE model=?", (model_id,)).fetchone()
+        if row is None:
+            return None, None
+        return os.path.join(self.path, row[0]), row[1]
+
+    def get(self, model_id: str, hashes: list[str]) -> dict:
+        """Return the stored vectors of the given text hashes, missing hashes are left out."""
+        with self.lock:
+            file, dim = self.model_file(model_id)
+            if file is None:
+                return {}
+            rows = {}
+            for i in range(0, len(hashes), MAX_QUERY_PARAMS):
+                chunk = hashes[i:i + MAX_QUERY_PARAMS]
+                rows.update(
+                    self.conn.execute(
+                        f"SELECT text_hash, row FROM vectors WHERE model=? AND text_hash IN ({','.join('?' * len(chunk))})",
+                        [model_id, *chunk],
+                    ).fetchall()
+                )
+            if not rows:
+                return {}
+            vectors = self.vectors.get(model_id)
+            if vectors is None or max(rows.values()) >= len(vectors):
+                # other writers appended since the file was mapped. Only whole
+                # rows are mapped, an interrupted put can leave part of one
+                num_rows = os.path.getsize(file) // (4 * dim)
+                vectors = self.vectors[model_id] = np.memmap(file, dtype=np.float32, mode="r", shape=(num_rows, dim))
+            found = list(rows)
+            return dict(zip(found, vectors[[rows[h] for h in found]]))
+
+    def put(self, model_id: str, hashes: list[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.lock:
+            # the write lock serializes row allocation between processes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                file, dim = self.model_file(model_id)
+                if file is None:
+                    dim = vectors.shape[1]
+                    name = text_hash(model_id)[:16] + ".f32"
+                    self.conn.execute("INSERT INTO models(model,file,dim) VALUES(?,?,?)", (model_id, name, dim))
+                    file = os.path.join(self.path, name)
+                if vectors.shape[1] != dim:
+                    raise ValueError(f"Expected {dim}-dimensional vectors for '{model_id}', got {vectors.shape[1]}.")
+                with open(file, "ab") as f:
+                    start = f.tell() // (4 * dim)
+                    # part of a row left by an interrupted put is cut off, no
+                    # row in the index points at it
+                    f.truncate(start * 4 * dim)
+                    f.write(vectors.tobytes())
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO vectors(model,text_hash,row) VALUES(?,?,?)",
+                    [(model_id, h, start + i) for i, h in enumerate(hashes)],
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def close(self):
+        self.vectors.clear()
+        self.conn.close()
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_store(path=EMBEDDING_STORE_PATH) -> EmbeddingStore:
+    """Return the store at path, shared so its rows are not allocated by two connections of one process."""
+    return EmbeddingStore(path)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings answered from an EmbeddingStore, only embedding texts it has not seen.
+
+    Identical texts in a call are embedded once, and missing texts are sent to
+    the wrapped embeddings in batches of batch_size, queries too when the
+    wrapped embeddings have an embed_queries method. Query embeddings are
+    kept apart from document embeddings since models may embed them
+    differently.
+    """
+
+    def __init__(self, embeddings, store=None, model_id=None, batch_size=EMBEDDING_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.store = store if store is not None else get_embedding_store()
+        self.model_id = model_id or getattr(embeddings, "model_id", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def embed(self, texts: list[str], query=False) -> np.ndarray:
+        """Embed texts as an array with one row per text."""
+        model_id = self.model_id + (":query" if query else "")
+        hashes = [text_hash(text) for text in texts]
+        unique = dict(zip(hashes, texts))
+        found = self.store.get(model_id, list(unique))
+        missing = [h for h in unique if h not in found]
+        with self.lock:
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            batch_texts = [unique[h] for h in batch]
+            if query and hasattr(self.embeddings, "embed_queries"):
+                vectors = np.asarray(self.embeddings.embed_queries(batch_texts), dtype=np.float32)
+            elif query:
+                # embed_query takes one text, so each query is its own call
+                vectors = np.asarray([self.embeddings.embed_query(text) for text in batch_texts], dtype=np.float32)
+            else:
+                vectors = np.asarray(self.embeddings.embed_documents(batch_texts), dtype=np.float32)
+            self.store.put(model_id, batch, vectors)
+            found.update(zip(batch, vectors))
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[h] for h in hashes])
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed([text], query=True)[0].tolist()
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.store),
+        }
@@ -0,0 +1,20 @@
+from nltk.metrics.segmentation import pk, windowdiff
+
+# window sizes of the k-sweeps in the evaluation notebooks
+KS = [2, 3, 4, 5, 6, 7, 10, 14, 20]
+
+
+def predictions_to_labels(predictions: list[bool]) -> list[int]:
+    # a sentence that does not continue the paragraph starts a new segment
+    return [0 if p == True else 1 for p in predictions]
+
+
+def evaluate(labels: list[int], predictions: list[bool], ks=KS) -> dict:
+    """Compute pk and windowdiff for every k shorter than the sequence, as the notebooks do."""
+    str_labels = "".join([str(x) for x in labels])
+    str_predictions = "".join([str(x) for x in predictions_to_labels(predictions)])
+    return {
+        k: {"pk": pk(str_labels, str_predictions, k=k), "wd": windowdiff(str_labels, str_predictions, k=k)}
+        for k in ks
+        if k < len(str_labels)
+    }
@@ -10,5 +10,16 @@ def get_embedding_function():
     return embeddings
 
 def get_embedding_function_ollama():
-    embeddings = OllamaEmbeddings(model="nomic-embed-text")
-    return embeddings
\ No newline at end of file
+    from .backends import PooledOllamaEmbeddings
+
+    # batches of texts in one request over the shared keep-alive session
+    embeddings = PooledOllamaEmbeddings(model="nomic-embed-text")
+    return embeddings
+
+def get_cached_embedding_function(embeddings=None, path=None):
+    """Wrap an embedding function (Ollama by default) so texts embedded before are read from disk."""
+    from .embedding_store import EMBEDDING_STORE_PATH, CachedEmbeddings, get_embedding_store
+
+    if embeddings is None:
+        embeddings = get_embedding_function_ollama()
+    return CachedEmbeddings(embeddings, store=get_embedding_store(path or EMBEDDING_STORE_PATH))
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = "llm_cache.db"
+
+
+class ResponseCache:
+    """On-disk cache of LLM responses shared across runs and backends.
+
+    Entries are keyed by a hash of (model id, temperature, prompt template,
+    rendered prompt). Entries older than max_age seconds are treated as misses,
+    and once more than max_entries are stored the least recently used ones are
+    evicted. A read-only cache never writes to disk, which keeps evaluation
+    runs reproducible.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=None, max_age=None, read_only=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            # cache hits update accessed_at, avoid an fsync for each of them
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                """ CREATE TABLE IF NOT EXISTS responses (
+                        key text PRIMARY KEY,
+                        response text NOT NULL,
+                        created_at real NOT NULL,
+                        accessed_at real NOT NULL
+                    ); """
+            )
+            self.conn.commit()
+        self.num_entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(model_id, temperature, template, prompt, decoding=None) -> str:
+        """Hash the request. decoding names a non-default way of reading the response, e.g. "stream"."""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        fields = [model_id, temperature, template, prompt_hash]
+        if decoding is not None:
+            fields.append(decoding)
+        return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM responses WHERE key=?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self.conn.execute("UPDATE responses SET accessed_at=? WHERE key=?", (now, key))
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key, response: str):
+        if self.read_only:
+            return
+        with self.lock:
+            now = time.time()
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO responses(key,response,created_at,accessed_at) VALUES(?,?,?,?)",
+                (key, response, now, now),
+            )
+            if cur.rowcount:
+                self.num_entries += 1
+            else:
+                # replacing an existing key does not add an entry
+                self.conn.execute(
+                    "UPDATE responses SET response=?, created_at=?, accessed_at=? WHERE key=?",
+                    (response, now, now, key),
+                )
+            self.conn.commit()
+        if self.max_entries is not None and self.num_entries > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Delete expired entries and trim the cache down to max_entries."""
+        if self.read_only:
+            return
+        with self.lock:
+            if self.max_age is not None:
+                self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self.conn.execute(
+                    """DELETE FROM responses WHERE key NOT IN (
+                           SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)""",
+                    (self.max_entries,),
+                )
+            self.conn.commit()
+            self.num_entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.num_entries,
+        }
+
+    def close(self):
+        self.conn.close()
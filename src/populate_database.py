@@ -1,33 +1,237 @@
 import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import os
 import shutil
 from langchain.document_loaders.pdf import PyPDFDirectoryLoader
-from langchain_community.document_loaders import DirectoryLoader
+from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
 from langchain.vectorstores.chroma import Chroma
 from langchain.schema import Document
 
-from .get_embedding_function import get_embedding_function, get_embedding_function_ollama
+from .dataset.choi import CHUNK_SIZE, RefSplitter
+from .get_embedding_function import get_embedding_function, get_cached_embedding_function
 
 
 CHROMA_PATH = "chroma"
+INDEX_PATH = "vector_index"
 DATA_PATH = "../data/choi/1/3-11"
+# chunks embedded and written to the store at a time
+WRITE_BATCH_SIZE = 256
+# files loaded and split in parallel
+MAX_WORKERS = os.cpu_count() or 1
+# file mtimes, hashes and chunk ids of the ingested files, kept next to the store
+MANIFEST_NAME = "manifest.json"
+# hex digits of the content hash in chunk ids
+CHUNK_HASH_LENGTH = 16
+# chunks of the files that are not .ref files
+SPLIT_CHUNK_SIZE = 800
+SPLIT_CHUNK_OVERLAP = 80
 
-def populate_database():
 
-    # # Check if the database should be cleared (using the --clear flag).
-    # parser = argparse.ArgumentParser()
-    # parser.add_argument("--reset", action="store_true", help="Reset the database.")
-    # args = parser.parse_args()
-    # if args.reset:
-    #     print("✨ Clearing Database")
-    #     clear_database()
+def main():
+    parser = argparse.ArgumentParser(description="Load, split, embed and store the documents under the data paths.")
+    parser.add_argument("data_paths", nargs="*", default=[DATA_PATH], help="Files or directories to ingest.")
+    parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    parser.add_argument("--index", action="store_true", help=f"Store the chunks in a VectorIndex at {INDEX_PATH} instead of Chroma.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Processes loading and splitting files.")
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE, help="Chunks embedded and written at a time.")
+    args = parser.parse_args()
+    if args.reset:
+        print("✨ Clearing Database")
+        clear_database(INDEX_PATH if args.index else CHROMA_PATH)
 
-    # Create (or update) the data store.
-    documents = load_documents()
-    chunks = split_documents(documents)
-    add_to_chroma(chunks)
+    db = None
+    if args.index:
+        from .vector_index import VectorIndex
+
+        db = VectorIndex(INDEX_PATH, embedding_function=get_cached_embedding_function())
+    populate_database(args.data_paths, db=db, max_workers=args.workers, batch_size=args.batch_size)
+
+
+def populate_database(data_paths=(DATA_PATH,), db=None, manifest_path=None, max_workers=MAX_WORKERS, batch_size=WRITE_BATCH_SIZE):
+    """Bring the store in line with the files under data_paths.
+
+    A manifest next to the store records the mtime, size, hash, splitter
+    settings and chunk ids of every ingested file. Files whose mtime and
+    size (or else hash) and splitter settings are unchanged are skipped
+    without reading them. Changed files are loaded and split in a process
+    pool, and only their new chunks are embedded and written, batch_size at
+    a time, while chunks they no longer have are deleted. Chunks of files
+    removed from data_paths are deleted too. The manifest is saved after
+    every batch, so an interrupted run continues where it stopped when
+    started again. A store with chunks but no manifest is refused, it has
+    to be reset first.
+    """
+    if db is None:
+        db = Chroma(persist_directory=CHROMA_PATH, embedding_function=get_cached_embedding_function())
+    if manifest_path is None:
+        # Chroma keeps its directory in _persist_directory, VectorIndex in persist_directory
+        store_path = getattr(db, "persist_directory", None) or getattr(db, "_persist_directory", None) or CHROMA_PATH
+        manifest_path = os.path.join(store_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path) and db.get(limit=1, include=[])["ids"]:
+        # chunks added without a manifest have ids from before the content
+        # hashes, adding the files again would store every chunk twice
+        raise ValueError(f"The store has chunks but no {manifest_path}, run with --reset to rebuild it.")
+    manifest = load_manifest(manifest_path)
+    seen = set()
+    num_skipped = num_added = num_deleted = 0
+
+    def changed_files():
+        nonlocal num_skipped
+        for path in iter_files(data_paths):
+            seen.add(path)
+            stat = os.stat(path)
+            entry = manifest.get(path)
+            splitter = splitter_config(path)
+            # a file split another way than its stored chunks is changed
+            if entry is not None and entry.get("splitter") != splitter:
+                entry = None
+            if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                num_skipped += 1
+                continue
+            digest = file_hash(path)
+            if entry is not None and entry["hash"] == digest:
+                # touched but not changed
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                num_skipped += 1
+                continue
+            yield path, {"mtime": stat.st_mtime, "size": stat.st_size, "hash": digest, "splitter": splitter}
+
+    # (chunks queued up to and including the file, path, entry) of files not
+    # fully written yet, they enter the manifest once all their chunks are
+    pending = deque()
+    batch = []
+    num_queued = 0
+
+    def write_batches(final=False):
+        nonlocal num_added
+        while len(batch) >= batch_size or (final and batch):
+            chunks = batch[:batch_size]
+            del batch[:batch_size]
+            db.add_documents(chunks, ids=[chunk.metadata["id"] for chunk in chunks])
+            num_added += len(chunks)
+            print(f"👉 Adding new documents: {num_added}")
+        if pending and pending[0][0] <= num_added:
+            while pending and pending[0][0] <= num_added:
+                _, path, entry = pending.popleft()
+                manifest[path] = entry
+            save_manifest(manifest_path, manifest)
+
+    for (path, entry), chunks in iter_split_files(changed_files(), max_workers=max_workers):
+        chunks = list(calculate_chunk_ids(chunks))
+        entry["chunk_ids"] = [chunk.metadata["id"] for chunk in chunks]
+        old_ids = set(manifest.get(path, {}).get("chunk_ids", []))
+        removed = old_ids.difference(entry["chunk_ids"])
+        if removed:
+            db.delete(ids=list(removed))
+            num_deleted += len(removed)
+        new_chunks = [chunk for chunk in chunks if chunk.metadata["id"] not in old_ids]
+        batch.extend(new_chunks)
+        num_queued += len(new_chunks)
+        pending.append((num_queued, path, entry))
+        write_batches()
+    write_batches(final=True)
+
+    # compared as absolute paths, "./data" and "data" name the same files
+    roots = [os.path.abspath(data_path) for data_path in data_paths]
+    for path in [path for path in manifest if path not in seen]:
+        absolute = os.path.abspath(path)
+        if any(absolute == root or absolute.startswith(root + os.sep) for root in roots):
+            removed = manifest.pop(path)["chunk_ids"]
+            if removed:
+                db.delete(ids=removed)
+                num_deleted += len(removed)
+    save_manifest(manifest_path, manifest)
+
+    if num_added or num_deleted:
+        if hasattr(db, "persist"):
+            db.persist()
+    print(f"✅ {num_skipped} unchanged files skipped, {num_added} chunks added, {num_deleted} chunks deleted")
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # write a copy and swap it in so an interrupted save keeps the previous manifest
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_files(data_paths):
+    """Yield the normalized paths of the files under data_paths in a stable order, skipping hidden ones."""
+    for data_path in data_paths:
+        data_path = os.path.normpath(data_path)
+        if os.path.isfile(data_path):
+            yield data_path
+            continue
+        for root, dirs, files in os.walk(data_path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if not name.startswith("."):
+                    yield os.path.join(root, name)
+
+
+def iter_chunks(paths, max_workers=MAX_WORKERS):
+    """Load and split files in worker processes, yielding their chunks in file order."""
+    for _, chunks in iter_split_files(((path, None) for path in paths), max_workers=max_workers):
+        yield from chunks
+
+
+def iter_split_files(items, max_workers=MAX_WORKERS):
+    """Load and split the files of (path, value) items in worker processes, yielding ((path, value), chunks) in order."""
+    if max_workers <= 1:
+        for item in items:
+            yield item, load_and_split(item[0])
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # a bounded number of files in flight keeps memory flat
+        in_flight = deque()
+        for item in items:
+            in_flight.append((item, executor.submit(load_and_split, item[0])))
+            if len(in_flight) >= 2 * max_workers:
+                item, future = in_flight.popleft()
+                yield item, future.result()
+        while in_flight:
+            item, future = in_flight.popleft()
+            yield item, future.result()
+
+
+def splitter_config(path: str) -> dict:
+    """Name the splitter and settings load_and_split uses for path, stored with the chunks of the file."""
+    if path.endswith(".ref"):
+        return {"splitter": "RefSplitter", "chunk_size": CHUNK_SIZE}
+    return {"splitter": "RecursiveCharacterTextSplitter", "chunk_size": SPLIT_CHUNK_SIZE, "chunk_overlap": SPLIT_CHUNK_OVERLAP}
+
+
+def load_and_split(path: str) -> list[Document]:
+    if path.endswith(".ref"):
+        return RefSplitter(CHUNK_SIZE).split_documents(load_file(path))
+    return split_documents(load_file(path))
+
+
+def load_file(path: str) -> list[Document]:
+    if path.endswith(".pdf"):
+        return PyPDFLoader(path).load()
+    return TextLoader(path, encoding="utf-8").load()
 
 
 def load_documents():
@@ -36,87 +240,85 @@ def load_documents():
 
 def split_documents(documents: list[Document]):
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=80,
+        chunk_size=SPLIT_CHUNK_SIZE,
+        chunk_overlap=SPLIT_CHUNK_OVERLAP,
         length_function=len,
         is_separator_regex=False,
     )
     return text_splitter.split_documents(documents)
 
 
-def add_to_chroma(chunks: list[Document]):
-    # Load the existing database.
+def batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def add_to_chroma(chunks, db=None, batch_size=WRITE_BATCH_SIZE):
+    # Load the existing database, a VectorIndex can be passed instead.
     # db = Chroma(
     #     persist_directory=CHROMA_PATH, embedding_function=get_embedding_function()
     # )
-    db = Chroma(
-        persist_directory=CHROMA_PATH, embedding_function=get_embedding_function_ollama()
-    )
+    if db is None:
+        db = Chroma(
+            persist_directory=CHROMA_PATH, embedding_function=get_cached_embedding_function()
+        )
+
+    # Only add the chunks that are not in the DB yet, looked up batch_size at a time.
+    num_added = 0
+    for batch in batched(calculate_chunk_ids(chunks), batch_size):
+        existing_ids = set(db.get(ids=[chunk.metadata["id"] for chunk in batch], include=[])["ids"])
+        new_chunks = [chunk for chunk in batch if chunk.metadata["id"] not in existing_ids]
+        if new_chunks:
+            db.add_documents(new_chunks, ids=[chunk.metadata["id"] for chunk in new_chunks])
+            num_added += len(new_chunks)
+            print(f"👉 Adding new documents: {num_added}")
 
-    # Calculate Page IDs.
-    chunks_with_ids = calculate_chunk_ids(chunks)
-
-    # Add or Update the documents.
-    existing_items = db.get(include=[])  # IDs are always included by default
-    existing_ids = set(existing_items["ids"])
-    print(f"Number of existing documents in DB: {len(existing_ids)}")
-
-    # Only add documents that don't exist in the DB.
-    new_chunks = []
-    for chunk in chunks_with_ids:
-        if chunk.metadata["id"] not in existing_ids:
-            new_chunks.append(chunk)
-
-    if len(new_chunks):
-        print(f"👉 Adding new documents: {len(new_chunks)}")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        db.add_documents(new_chunks, ids=new_chunk_ids)
-        db.persist()
+    if num_added:
+        if hasattr(db, "persist"):
+            db.persist()
     else:
         print("✅ No new documents to add")
 
 
 def calculate_chunk_ids(chunks):
+    """Set the id of every chunk from its source and content, yielding the chunks as they come.
 
-    # This will create IDs like "data/monopoly.pdf:6:2"
-    # Page Source : Page Number : Chunk Index
+    Editing a file only changes the ids of the chunks whose text changed.
+    """
+
+    # This will create IDs like "data/monopoly.pdf:3f2a9c0d1e7b4a6c"
+    # Source : Content Hash (: Occurrence, for repeated chunks of a source)
 
-    last_page_id = None
-    current_chunk_index = 0
-    prev_page = 0
     prev_source = None
+    occurrences = Counter()
 
     for chunk in chunks:
         source = chunk.metadata.get("source")
-        # if there's no page attribute that exists, calculate the page based on the source.
         if source != prev_source:
-            prev_page += 1
-        page = chunk.metadata.get("page", prev_page)
-
-        # sync these counters
-        prev_source = source
-        prev_page = page
-        current_page_id = f"{source}:{page}"
+            occurrences.clear()
+            prev_source = source
 
-        # If the page ID is the same as the last one, increment the index.
-        if current_page_id == last_page_id:
-            current_chunk_index += 1
-        else:
-            current_chunk_index = 0
-
-        # Calculate the chunk ID.
-        chunk_id = f"{current_page_id}:{current_chunk_index}"
-        last_page_id = current_page_id
+        content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()[:CHUNK_HASH_LENGTH]
+        chunk_id = f"{source}:{content_hash}"
+        occurrence = occurrences[chunk_id]
+        occurrences[chunk_id] += 1
+        if occurrence:
+            chunk_id = f"{chunk_id}:{occurrence}"
 
         # Add it to the page meta-data.
         chunk.metadata["id"] = chunk_id
-
-    return chunks
+        yield chunk
 
 
-def clear_database():
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
+def clear_database(path=CHROMA_PATH):
+    if os.path.exists(path):
+        shutil.rmtree(path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+import string
+
+# ChatPromptTemplate renders its single human message with this role prefix
+HUMAN_PREFIX = "Human: "
+
+
+class CompiledPrompt:
+    """Prompt template parsed once and rendered with a plain str.format call.
+
+    format() returns the same string as
+    ChatPromptTemplate.from_template(template).format(**kwargs) without
+    building the message and prompt value objects on every call.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self.input_variables = sorted(
+            {field_name for _, field_name, _, _ in string.Formatter().parse(template) if field_name is not None}
+        )
+        self.format_string = HUMAN_PREFIX + template
+
+    def format(self, **kwargs) -> str:
+        missing = [name for name in self.input_variables if name not in kwargs]
+        if missing:
+            raise KeyError(f"Missing prompt variables: {', '.join(missing)}")
+        return self.format_string.format_map(kwargs)
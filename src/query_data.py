@@ -1,9 +1,9 @@
 import argparse
 from langchain.vectorstores.chroma import Chroma
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms.ollama import Ollama
 
-from .get_embedding_function import get_embedding_function, get_embedding_function_ollama
+from .backends import get_model
+from .prompt_template import CompiledPrompt
+from .get_embedding_function import get_embedding_function, get_cached_embedding_function
 
 CHROMA_PATH = "chroma"
 
@@ -18,6 +18,8 @@ Answer the question based on the context provided:
 Answer the question based on the above context: {question}
 """
 
+prompt_template = CompiledPrompt(PROMPT_TEMPLATE)
+
 
 def main():
     # Create CLI.
@@ -37,18 +39,17 @@ def query_data(query_text: str):
 def query_rag(query_text: str):
     # Prepare the DB.
     # embedding_function = get_embedding_function()
-    embedding_function = get_embedding_function_ollama()
+    embedding_function = get_cached_embedding_function()
     db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
 
     # Search the DB.
     results = db.similarity_search_with_score(query_text, k=5)
 
     context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     prompt = prompt_template.format(context=context_text, question=query_text)
     # print(prompt)
 
-    model = Ollama(model="mistral")
+    model = get_model("mistral")
     response_text = model.invoke(prompt)
 
     sources = [doc.metadata.get("id", None) for doc, _score in results]
@@ -1,10 +1,14 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms.ollama import Ollama
+import numpy as np
+from langchain.schema.document import Document
 from langchain.vectorstores.chroma import Chroma
 
-from .get_embedding_function import get_embedding_function, get_embedding_function_ollama
+from .backends import get_model
+from .prompt_template import CompiledPrompt
+from .get_embedding_function import get_embedding_function, get_cached_embedding_function
 
 CHROMA_PATH = "chroma"
+# chunks retrieved as context for each question
+RETRIEVED_CHUNKS = 5
 
 PROMPT_TEMPLATE = """
 Answer the question based on the context provided:
@@ -26,11 +30,27 @@ Sentence 2: {sentence_2}
 If they are, output "True". If they are not, output "False"
 """
 
-query_prompt_template = ChatPromptTemplate.from_template(QUERY_PROMPT)
+query_prompt_template = CompiledPrompt(QUERY_PROMPT)
 
 class RAG:
-    def __init__(self):
-        pass
+    """Answers questions from the chunks in the Chroma store.
+
+    The embedding function, the store and the model are opened once and
+    reused for every query. Close the instance, or use it as a context
+    manager, to release the store.
+    """
+
+    def __init__(self, model=None, embedding_function=None, db=None, persist_directory=CHROMA_PATH, k=RETRIEVED_CHUNKS, cache=None):
+        self.prompt_template = CompiledPrompt(PROMPT_TEMPLATE)
+        # embedding_function = get_embedding_function()
+        self.embedding_function = embedding_function if embedding_function is not None else get_cached_embedding_function()
+        # only a store opened here is closed by close()
+        self.owns_db = db is None
+        self.db = db if db is not None else Chroma(persist_directory=persist_directory, embedding_function=self.embedding_function)
+        self.model = model or get_model("mistral")
+        self.k = k
+        # RetrievalCache shared by the queries of this instance
+        self.cache = cache
 
     def query_data(self, query_text: str):
         assert query_text is not None, "Query text is required."
@@ -39,33 +59,102 @@ class RAG:
     def query_batch_data(self, query_text_arr: list[str]) -> list[bool]:
         assert query_text_arr is not None, "Queries are required."
         assert len(query_text_arr) > 0, "Queies are required."
-        predictions = []
-        for i, query in enumerate(query_text_arr):
-            if i == 0:
-                continue
-            sentence_1 = query_text_arr[i - 1]
-            sentence_2 = query
-            prompt = query_prompt_template.format(sentence_1=sentence_1, sentence_2=sentence_2)
-            predictions.append(self.query_rag(prompt))
-        return predictions
+        prompts = [
+            query_prompt_template.format(sentence_1=sentence_1, sentence_2=sentence_2)
+            for sentence_1, sentence_2 in zip(query_text_arr, query_text_arr[1:])
+        ]
+        if not prompts:
+            return []
+        # one embedding call and one search for all pairs of the document
+        results = self.retrieve(prompts)
+        return [self.answer(prompt, prompt_results) for prompt, prompt_results in zip(prompts, results)]
+
+    def embed_queries(self, query_texts: list[str]):
+        if hasattr(self.embedding_function, "embed"):
+            return self.embedding_function.embed(query_texts, query=True)
+        return [self.embedding_function.embed_query(text) for text in query_texts]
+
+    def search_batch(self, query_embeddings, k=RETRIEVED_CHUNKS) -> list[list[tuple[Document, float]]]:
+        """Return the k nearest chunks and their distances for every query embedding.
+
+        Chroma and VectorIndex answer all queries in a single call, other
+        stores are searched once per query.
+        """
+        if hasattr(self.db, "similarity_search_batch"):
+            return self.db.similarity_search_batch(query_embeddings, k=k)
+        collection = getattr(self.db, "_collection", None)
+        if collection is None:
+            return [self.db.similarity_search_by_vector_with_relevance_scores(list(embedding), k=k) for embedding in query_embeddings]
+        results = collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            [
+                (Document(page_content=document, metadata=metadata or {}), distance)
+                for document, metadata, distance in zip(documents, metadatas, distances)
+            ]
+            for documents, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+        ]
+
+    def retrieve(self, query_texts: list[str]) -> list[list[tuple[Document, float]]]:
+        """Retrieve the chunks of every query, searching the store only for queries missing from the cache."""
+        if self.cache is None:
+            return self.search_batch(self.embed_queries(query_texts), k=self.k)
+
+        results = [None] * len(query_texts)
+        if self.cache.similarity_threshold is None:
+            for i, query_text in enumerate(query_texts):
+                results[i] = self.cache.get(query_text, self.k)
+            missing = [i for i, result in enumerate(results) if result is None]
+            embeddings = dict(zip(missing, self.embed_queries([query_texts[i] for i in missing]))) if missing else {}
+        else:
+            # similar queries are found by their embeddings, so every query is embedded
+            embeddings = dict(enumerate(self.embed_queries(query_texts)))
+            for i, query_text in enumerate(query_texts):
+                results[i] = self.cache.get(query_text, self.k, embedding=embeddings[i])
+            missing = [i for i, result in enumerate(results) if result is None]
+
+        # a query repeated within the batch is searched once
+        unique = {}
+        for i in missing:
+            unique.setdefault(query_texts[i], i)
+        if unique:
+            searched = dict(zip(unique, self.search_batch([embeddings[i] for i in unique.values()], k=self.k)))
+            for query_text, i in unique.items():
+                self.cache.put(query_text, self.k, searched[query_text], embedding=embeddings[i])
+            for i in missing:
+                results[i] = searched[query_texts[i]]
+        return results
 
     def query_rag(self, query_text: str):
-        # Prepare the DB.
-        # embedding_function = get_embedding_function()
-        embedding_function = get_embedding_function_ollama()
-        db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-
         # Search the DB.
-        results = db.similarity_search_with_score(query_text, k=5)
+        if self.cache is None:
+            results = self.db.similarity_search_with_score(query_text, k=self.k)
+        else:
+            results = self.retrieve([query_text])[0]
+        return self.answer(query_text, results)
 
+    def answer(self, query_text: str, results):
         context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-        prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-        prompt = prompt_template.format(context=context_text, question=query_text)
+        prompt = self.prompt_template.format(context=context_text, question=query_text)
 
-        model = Ollama(model="mistral")
-        response_text = model.invoke(prompt)
+        response_text = self.model.invoke(prompt)
 
         sources = [doc.metadata.get("id", None) for doc, _score in results]
         # formatted_response = f"Response: {response_text}\nSources: {sources}"
         return bool(response_text)
-    
\ No newline at end of file
+
+    def close(self):
+        if self.owns_db and self.db is not None:
+            client = getattr(self.db, "_client", None)
+            if hasattr(client, "close"):
+                client.close()
+        self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+import numpy as np
+
+# retrieved chunk lists kept in memory
+RETRIEVAL_CACHE_SIZE = 10000
+
+
+class RetrievalCache:
+    """In-memory LRU cache of the chunks retrieved for a query.
+
+    Entries are keyed by a hash of the query text and the number of chunks
+    retrieved. With a similarity_threshold, a query missing from the cache
+    reuses the chunks of a cached query whose embedding has at least that
+    cosine similarity to its own. Once more than max_entries are stored the
+    least recently used ones are evicted.
+    """
+
+    def __init__(self, max_entries=RETRIEVAL_CACHE_SIZE, similarity_threshold=None):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        self.embeddings = {}
+        # stacked embeddings of the cached queries, rebuilt after entries change
+        self.matrix = None
+        self.matrix_keys = []
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(query_text: str, k: int) -> tuple:
+        return hashlib.sha256(query_text.encode("utf-8")).hexdigest(), k
+
+    def get(self, query_text: str, k: int, embedding=None):
+        """Return the cached chunks of the query, or None.
+
+        Similar queries are only looked up when the embedding of the query is given.
+        """
+        key = self.key(query_text, k)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            if self.similarity_threshold is not None and embedding is not None:
+                similar_key = self.find_similar(np.asarray(embedding, dtype=np.float32), k)
+                if similar_key is not None:
+                    self.entries.move_to_end(similar_key)
+                    self.similar_hits += 1
+                    return self.entries[similar_key]
+            self.misses += 1
+            return None
+
+    def find_similar(self, embedding, k):
+        if not self.embeddings:
+            return None
+        if self.matrix is None:
+            self.matrix_keys = list(self.embeddings)
+            self.matrix = np.stack([self.embeddings[key] for key in self.matrix_keys])
+        similarities = self.matrix @ (embedding / max(np.linalg.norm(embedding), 1e-12))
+        # only entries that retrieved the same number of chunks are interchangeable
+        similarities[[key[1] != k for key in self.matrix_keys]] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return self.matrix_keys[best]
+
+    def put(self, query_text: str, k: int, results, embedding=None):
+        key = self.key(query_text, k)
+        with self.lock:
+            self.entries[key] = results
+            self.entries.move_to_end(key)
+            if embedding is not None and self.similarity_threshold is not None:
+                embedding = np.asarray(embedding, dtype=np.float32)
+                self.embeddings[key] = embedding / max(np.linalg.norm(embedding), 1e-12)
+                self.matrix = None
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                if self.embeddings.pop(evicted, None) is not None:
+                    self.matrix = None
+                self.evictions += 1
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.similar_hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.similar_hits) / total if total else 0.0,
+            "entries": len(self.entries),
+            "evictions": self.evictions,
+        }
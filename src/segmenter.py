@@ -0,0 +1,84 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .get_embedding_function import get_cached_embedding_function
+
+# sentences on each side of a gap compared by the block similarity
+BLOCK_SIZE = 3
+# a gap is a boundary when its depth is above mean - DEPTH_CUTOFF * std of all depths
+DEPTH_CUTOFF = 0.5
+
+
+def normalize(embeddings) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+def block_similarities(embeddings: np.ndarray, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    """Mean cosine similarity between the blocks of sentences before and after each gap.
+
+    The mean of a block of the cosine-similarity matrix is the dot product of
+    the summed unit embeddings of both sides divided by the block area, so
+    prefix sums give every gap score in O(n * d) without building the n x n
+    matrix. Gap i sits between sentences i and i + 1.
+    """
+    n = len(embeddings)
+    prefix = np.vstack([np.zeros((1, embeddings.shape[1]), dtype=np.float64), np.cumsum(embeddings, axis=0, dtype=np.float64)])
+    gaps = np.arange(1, n)
+    left_start = np.maximum(gaps - block_size, 0)
+    right_end = np.minimum(gaps + block_size, n)
+    left = prefix[gaps] - prefix[left_start]
+    right = prefix[right_end] - prefix[gaps]
+    return np.einsum("ij,ij->i", left, right) / ((gaps - left_start) * (right_end - gaps))
+
+
+def depth_scores(similarities: np.ndarray, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    """How far each gap score dips below the highest scores within block_size gaps on either side."""
+    padded = np.pad(similarities, block_size, mode="edge")
+    windows = sliding_window_view(padded, 2 * block_size + 1)
+    left_peak = windows[:, :block_size + 1].max(axis=1)
+    right_peak = windows[:, block_size:].max(axis=1)
+    return (left_peak - similarities) + (right_peak - similarities)
+
+
+class EmbeddingSegmenter:
+    """TextTiling-style segmenter scoring block depths over sentence embeddings.
+
+    Shares the query_batch_data interface of Determinor: one prediction per
+    sentence, True when it continues the current segment.
+    """
+
+    def __init__(self, embedding_function=None, block_size=BLOCK_SIZE, depth_cutoff=DEPTH_CUTOFF, threshold=None):
+        self.embedding_function = embedding_function if embedding_function is not None else get_cached_embedding_function()
+        self.block_size = block_size
+        self.depth_cutoff = depth_cutoff
+        # fixed depth above which a gap is a boundary, instead of the cutoff relative to the document
+        self.threshold = threshold
+
+    def query_batch_data(self, sentences: list[str]) -> list[bool]:
+        assert sentences is not None, "Sentences are required."
+        assert len(sentences) > 0, "Sentences are required."
+        embeddings = normalize(self.embedding_function.embed_documents(sentences))
+        return self.segment(embeddings)
+
+    def query_batch_documents(self, documents: list[list[str]]) -> list[list[bool]]:
+        """Embed all documents in one call and segment each of them."""
+        assert documents is not None, "Documents are required."
+        assert len(documents) > 0, "Documents are required."
+        embeddings = normalize(self.embedding_function.embed_documents([s for document in documents for s in document]))
+        offsets = np.cumsum([0] + [len(document) for document in documents])
+        return [self.segment(embeddings[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def segment(self, embeddings: np.ndarray) -> list[bool]:
+        if len(embeddings) < 3:
+            return [True] * len(embeddings)
+        depths = depth_scores(block_similarities(embeddings, self.block_size), self.block_size)
+        threshold = self.threshold if self.threshold is not None else depths.mean() - self.depth_cutoff * depths.std()
+
+        # keep the deepest gap of each valley so neighbouring gaps are not both boundaries
+        padded = np.pad(depths, 1, constant_values=-np.inf)
+        local_max = (depths >= padded[:-2]) & (depths > padded[2:])
+        boundaries = (depths > threshold) & local_max & (depths > 0)
+
+        # the first sentence continues whatever came before it
+        return [True] + (~boundaries).tolist()
@@ -0,0 +1,87 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import pytest
+
+from src import backends
+from src.backends import VERDICT_TOKENS, PooledOllama, PooledOllamaEmbeddings, get_model, get_verdict_model, register_backend
+from src.determinor import Determinor
+from src.test_determinor import FakeModel
+
+
+class OllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+    requests = []
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(request)
+        self.client_ports.append(self.client_address[1])
+        if self.path == "/api/embed":
+            body = json.dumps({"embeddings": [[float(len(text)), 1.0] for text in request["input"]]}).encode("utf-8")
+        else:
+            body = (json.dumps({"response": "True", "done": True}) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_registered_backend_is_built_once_and_shared(monkeypatch):
+    # the registry and its clients are restored after the test
+    monkeypatch.setattr(backends, "BACKENDS", dict(backends.BACKENDS))
+    monkeypatch.setattr(backends, "models", {})
+    register_backend("fake", FakeModel)
+
+    determinor = Determinor(backend="fake")
+    assert isinstance(determinor.model, FakeModel)
+    assert Determinor(backend="fake").model is determinor.model
+    assert determinor.query_batch_data(["s1", "NEW s2"]) == [True, False]
+
+
+def test_unknown_backend_raises():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        get_model("missing")
+
+
+def test_pooled_ollama_reuses_connection(ollama_server):
+    OllamaHandler.client_ports = []
+    model = PooledOllama(model="mistral", base_url=ollama_server)
+
+    assert [model.invoke("prompt") for _ in range(3)] == ["True"] * 3
+    assert len(set(OllamaHandler.client_ports)) == 1
+
+
+def test_verdict_model_limits_ollama_tokens(ollama_server):
+    OllamaHandler.requests = []
+    model = get_verdict_model(PooledOllama(model="mistral", base_url=ollama_server))
+
+    assert model.invoke("prompt") == "True"
+    assert OllamaHandler.requests[0]["options"]["num_predict"] == VERDICT_TOKENS
+
+
+def test_pooled_ollama_embeddings_send_one_request_per_batch(ollama_server):
+    OllamaHandler.client_ports = []
+    OllamaHandler.requests = []
+    embeddings = PooledOllamaEmbeddings(model="nomic-embed-text", base_url=ollama_server, embed_instruction="", query_instruction="q ")
+
+    assert embeddings.embed_documents(["a", "bb", "ccc"]) == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert embeddings.embed_queries(["a", "bb"]) == [[3.0, 1.0], [4.0, 1.0]]
+    assert [request["input"] for request in OllamaHandler.requests] == [["a", "bb", "ccc"], ["q a", "q bb"]]
+    assert len(set(OllamaHandler.client_ports)) == 1
+    assert embeddings.model_id == "nomic-embed-text/api/embed"
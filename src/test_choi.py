@@ -0,0 +1,44 @@
+from langchain.schema.document import Document
+
+from src.dataset.choi import RefSplitter, iter_ref_documents, parse_ref, read_ref
+
+REF = """==========
+First sentence of one .
+Second sentence of one .
+==========
+Only sentence of two .
+==========
+"""
+
+
+def test_parse_ref():
+    assert parse_ref(REF) == [["First sentence of one .", "Second sentence of one ."], ["Only sentence of two ."]]
+
+
+def test_chunks_stay_within_segments():
+    chunks = RefSplitter(chunk_size=30).split_documents([Document(page_content=REF, metadata={"source": "0.ref"})])
+
+    assert [chunk.page_content for chunk in chunks] == ["First sentence of one .", "Second sentence of one .", "Only sentence of two ."]
+    assert [(chunk.metadata["segment"], chunk.metadata["start_sentence"]) for chunk in chunks] == [(0, 0), (0, 1), (1, 2)]
+    assert chunks[0].metadata["source"] == "0.ref"
+
+    chunks = RefSplitter(chunk_size=48).split_documents([Document(page_content=REF)])
+    assert [chunk.page_content for chunk in chunks] == ["First sentence of one .\nSecond sentence of one .", "Only sentence of two ."]
+    assert [chunk.metadata["num_sentences"] for chunk in chunks] == [2, 1]
+
+
+def test_ref_document(tmp_path):
+    (tmp_path / "2").mkdir()
+    (tmp_path / "10").mkdir()
+    (tmp_path / "2" / "0.ref").write_text(REF)
+    (tmp_path / "10" / "0.ref").write_text("==========\nA .\n")
+
+    documents = list(iter_ref_documents(str(tmp_path)))
+    assert [document.source for document in documents] == [str(tmp_path / "2" / "0.ref"), str(tmp_path / "10" / "0.ref")]
+    document = documents[0]
+    assert len(document) == 3
+    assert document.sentence(1) == "Second sentence of one ."
+    assert document.sentence(2) == "Only sentence of two ."
+    assert document.labels.tolist() == [1, 0, 1]
+    assert document.segments() == parse_ref(REF)
+    assert read_ref(str(tmp_path / "2" / "0.ref")).text == document.text
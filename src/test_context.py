@@ -0,0 +1,65 @@
+from src.context import ContextWindow
+
+
+def test_keeps_last_sentences_joined():
+    window = ContextWindow(3)
+    for sentence in ["s1", "s2", "s3", "s4", "s5"]:
+        window.append(sentence)
+
+    assert list(window) == ["s3", "s4", "s5"]
+    assert window.text == "s3\ns4\ns5"
+
+
+def test_matches_slicing_a_growing_list():
+    sentences = ["", "a b", "", "c", "d e f", "", "g"]
+    for max_sentences in range(1, len(sentences) + 2):
+        window = ContextWindow(max_sentences)
+        for i, sentence in enumerate(sentences):
+            window.append(sentence)
+            assert window.text == "\n".join(sentences[:i + 1][-max_sentences:])
+
+
+def test_reset_starts_a_new_paragraph():
+    window = ContextWindow(3)
+    window.append("s1")
+    window.append("s2")
+    window.reset("s3")
+
+    assert list(window) == ["s3"]
+    assert window.text == "s3"
+
+
+def test_token_budget_evicts_oldest_sentences():
+    window = ContextWindow(10, max_tokens=5, token_counter=lambda sentence: len(sentence.split()))
+    window.append("one two")
+    window.append("three four")
+    assert window.num_tokens == 4
+
+    window.append("five six")
+    assert list(window) == ["three four", "five six"]
+    assert window.num_tokens == 4
+
+    # the latest sentence is kept even when it is over budget on its own
+    window.append("a b c d e f g")
+    assert list(window) == ["a b c d e f g"]
+    assert window.text == "a b c d e f g"
+
+
+def test_copy_is_independent():
+    window = ContextWindow(3)
+    window.append("s1")
+    copy = window.copy()
+    copy.append("s2")
+
+    assert list(window) == ["s1"]
+    assert copy.text == "s1\ns2"
+
+
+def test_tail_text_fits_token_budget():
+    window = ContextWindow(10, token_counter=lambda sentence: len(sentence.split()))
+    for sentence in ["a b c", "d e", "f"]:
+        window.append(sentence)
+
+    assert window.tail_text(100) == "a b c\nd e\nf"
+    assert window.tail_text(5) == "d e\nf"
+    assert window.tail_text(1) == ""
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+
+import pytest
+
+# dbv2 changes into its own directory on import
+cwd = os.getcwd()
+from db import dbv2
+
+os.chdir(cwd)
+
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    monkeypatch.setattr(dbv2, "dname", str(tmp_path))
+    table = dbv2.Table("choi")
+    yield table
+    table.conn.close()
+
+
+SEGMENTS = [["a1", "a2", "a3"], ["b1"], [], ["c1", "c2"]]
+
+
+def test_import_segments_sets_parents(table):
+    stats = table.import_segments(SEGMENTS, batch_size=2)
+
+    assert stats["rows"] == 6
+    assert stats["segments"] == 3
+    assert stats["rows_per_second"] > 0
+    assert table.get_num_segments() == 3
+    rows = table.conn.execute("SELECT id, sentence, target, parent, sequence FROM choi ORDER BY id").fetchall()
+    assert rows == [
+        (1, "a1", 1, None, 0),
+        (2, "a2", 0, 1, 1),
+        (3, "a3", 0, 1, 2),
+        (4, "b1", 1, None, 0),
+        (5, "c1", 1, None, 0),
+        (6, "c2", 0, 5, 1),
+    ]
+    assert [row[1] for row in table.get_segment(5)] == ["c1", "c2"]
+
+
+def test_import_segments_appends_after_existing_rows(table):
+    table.create_segment(["x1", "x2"])
+    table.import_segments(SEGMENTS)
+
+    assert table.get_num_rows() == 8
+    assert [row[1] for row in table.get_segment(3)] == ["a1", "a2", "a3"]
+    # the import is committed and visible to other connections
+    other = sqlite3.connect(table.db_file)
+    assert other.execute("SELECT COUNT(*) FROM choi").fetchone()[0] == 8
+    other.close()
+
+
+def test_import_segments_rolls_back_failed_batch(table):
+    with pytest.raises(sqlite3.IntegrityError):
+        table.import_segments([["a1", "a2"], ["b1", None]], batch_size=100)
+
+    assert table.get_num_rows() == 0
+    assert not table.conn.in_transaction
+
+
+def test_import_segments_commits_an_open_transaction_first(table):
+    table.conn.execute(f"INSERT INTO {table.table_name}(sentence,target,parent,sequence) VALUES('x1',1,NULL,0)")
+    assert table.conn.in_transaction
+
+    table.import_segments(SEGMENTS)
+    assert table.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert table.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert [row[1] for row in table.get_segment(1)] == ["x1"]
+    assert table.get_num_rows() == 7
+
+
+@pytest.fixture
+def split_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(dbv2, "dname", str(tmp_path))
+    table = dbv2.Table("city")
+    table.import_segments([[f"{s}.{i}" for i in range(s % 4 + 1)] for s in range(40)])
+    train_test = dbv2.TrainTestTable("city")
+    train_test.create_train_test_split()
+    yield table
+    train_test.conn.close()
+    table.conn.close()
+
+
+def test_get_random_segments_matches_get_segment(split_table):
+    statements = []
+    split_table.conn.set_trace_callback(statements.append)
+    segments = split_table.get_random_segments(6, split="train", max_segment_size=2, seed=3)
+    split_table.conn.set_trace_callback(None)
+
+    assert len(segments) == 6
+    assert segments == [split_table.get_segment(segment[0][0], 2) for segment in segments]
+    assert all(segment[0][2] == 1 for segment in segments)
+    # the split and the segments are read with one query each
+    assert sum(statement.lstrip().upper().startswith(("SELECT", "WITH")) for statement in statements) == 2
+
+
+def test_random_sampling_is_seeded(split_table):
+    first = split_table.get_random_target_sentences(10, split="train", seed=7)
+    assert first == split_table.get_random_target_sentences(10, split="train", seed=7)
+    assert first != split_table.get_random_target_sentences(10, split="train", seed=8)
+    assert all(row[2] == 1 for row in first)
+    assert len({row[0] for row in first}) == 10
+    # asking for more than the split holds returns the whole split
+    assert len(split_table.get_random_target_sentences(1000, split="test", seed=7)) == 10
+
+
+def test_get_random_segments_artificial(split_table):
+    segments = split_table.get_random_segments(30, split="train", max_segment_size=2, artificial_segments=True, seed=0)
+
+    assert all(1 <= len(segment) <= 2 and segment[0][2] == 1 for segment in segments)
+    assert sum(map(len, segments)) == sum(len(split_table.get_segment(row[1])) for row in split_table.get_target_sentence_ids("train", 30, seed=0))
+
+
+def query_plan(table, sql, params):
+    return " ".join(row[3] for row in table.conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_segment_lookups_use_indexes(split_table):
+    name = split_table.table_name
+    get_segment = query_plan(split_table, f"SELECT * FROM {name} WHERE id=? OR parent=? ORDER BY sequence ASC LIMIT ?", (1, 1, 10))
+    assert f"USING INDEX {name}_parent_sequence" in get_segment
+    assert "SCAN" not in get_segment
+
+    targets = query_plan(split_table, f"SELECT * FROM {name} WHERE target=?", (1,))
+    assert f"USING INDEX {name}_target" in targets
+
+    split = query_plan(split_table, f"SELECT * FROM {name}_train_test WHERE type=? ORDER BY id ASC", ("test",))
+    assert f"USING COVERING INDEX {name}_train_test_type_segment_id" in split
+
+
+def test_indexes_are_added_to_existing_tables(tmp_path, monkeypatch):
+    monkeypatch.setattr(dbv2, "dname", str(tmp_path))
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("CREATE TABLE old (id integer PRIMARY KEY, sentence text NOT NULL, target integer NOT NULL, parent integer, sequence integer NOT NULL)")
+    conn.close()
+
+    table = dbv2.Table("old")
+    indexes = {row[0] for row in table.conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    table.conn.close()
+    assert indexes == {"old_parent_sequence", "old_target"}
+
+
+def test_iter_segments_streams_every_segment(table):
+    table.import_segments(SEGMENTS)
+
+    segments = list(table.iter_segments(fetch_size=2))
+    assert [[row[1] for row in segment] for segment in segments] == [["a1", "a2", "a3"], ["b1"], ["c1", "c2"]]
+    assert segments[2] == table.get_segment(5)
+    assert table.get_all_segments() == segments
+    # the last segment of the table is returned too
+    assert table.get_all_segments()[-1] == table.get_segment(5)
+
+    projected = list(table.iter_segments(columns=("sentence", "target")))
+    assert projected == [[("a1", 1), ("a2", 0), ("a3", 0)], [("b1", 1)], [("c1", 1), ("c2", 0)]]
@@ -0,0 +1,282 @@
+import math
+import re
+import threading
+import time
+
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage
+
+from src.determinor import MEETING_PROMPT, Determinor, apply_threshold, find_verdict, parse_boundaries
+
+
+class FakeModel:
+    """Answers "False" for sentences starting with "NEW" and "True" otherwise.
+
+    Batched prompts are answered with the numbers of the "NEW" sentences.
+    """
+
+    def __init__(self, delay=0.0, batch_response=None, reasoning="", explanation=""):
+        self.delay = delay
+        self.batch_response = batch_response
+        # streamed around the answer, word by word
+        self.reasoning = reasoning
+        self.explanation = explanation
+        self.streamed_chunks = 0
+        self.closed_streams = 0
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if "numbered sentences" in prompt:
+            if self.batch_response is not None:
+                return self.batch_response
+            positions = re.findall(r"^(\d+)\. NEW", prompt, flags=re.MULTILINE)
+            return "Boundaries: " + (", ".join(positions) or "none")
+        sentence = prompt.split("?\n\n")[-1].split("\n\nIf it does")[0]
+        return "False" if sentence.startswith("NEW") else "True"
+
+    def stream(self, prompt):
+        response_text = self.reasoning + self.invoke(prompt) + self.explanation
+        try:
+            for chunk in re.split(r"(?<= )", response_text):
+                self.streamed_chunks += 1
+                yield chunk
+        finally:
+            self.closed_streams += 1
+
+
+DOCUMENTS = [
+    ["a1", "a2", "NEW a3", "a4"],
+    ["NEW b1", "b2", "b3"],
+    ["c1", "NEW c2", "NEW c3", "c4", "c5"],
+]
+
+
+def test_query_batch_data_resets_paragraph_on_boundary():
+    model = FakeModel()
+    determinor = Determinor(model=model, max_context_window=2)
+    predictions = determinor.query_batch_data(DOCUMENTS[0])
+
+    assert predictions == [True, True, False, True]
+    assert list(determinor.prev_paragraph) == ["NEW a3", "a4"]
+    # the prompt for "a4" only carries the paragraph started at the boundary
+    assert "Given the following paragraph:\n\nNEW a3\n\n" in model.prompts[-1]
+
+
+def test_build_prompt_matches_chat_prompt_template():
+    paragraph = ["too old", "a {curly} sentence", "another one"]
+    determinor = Determinor(model=FakeModel(), meeting_dataset=True, max_context_window=2)
+    for sentence in paragraph:
+        determinor.prev_paragraph.append(sentence)
+    expected = ChatPromptTemplate.from_template(MEETING_PROMPT).format(prev_paragraph="\n".join(paragraph[-2:]), sentence="next")
+
+    assert determinor.build_prompt(determinor.prev_paragraph, "next") == expected
+
+
+def test_query_batch_documents_matches_sequential_order():
+    expected = [Determinor(model=FakeModel()).query_batch_data(document) for document in DOCUMENTS]
+
+    determinor = Determinor(model=FakeModel(), max_workers=3)
+    assert determinor.query_batch_documents(DOCUMENTS) == expected
+    # the parent determinor state is left untouched
+    assert list(determinor.prev_paragraph) == []
+
+
+def test_query_batch_documents_runs_documents_concurrently():
+    model = FakeModel(delay=0.01)
+    determinor = Determinor(model=model, max_workers=3)
+    determinor.query_batch_documents(DOCUMENTS)
+
+    assert model.max_in_flight == 3
+
+
+def test_query_speculative_matches_sequential():
+    sentences = ["s1", "s2", "s3", "NEW s4", "s5", "s6", "s7", "s8", "NEW s9", "NEW s10", "s11"]
+    sequential = Determinor(model=FakeModel(), max_context_window=3)
+    expected = sequential.query_batch_data(sentences)
+
+    for width in [2, 3, 5, 20]:
+        model = FakeModel()
+        speculative = Determinor(model=model, max_context_window=3, speculation_width=width)
+        assert speculative.query_batch_data(sentences) == expected
+        assert list(speculative.prev_paragraph) == list(sequential.prev_paragraph)
+        # every prompt the sequential path sends is also sent speculatively
+        assert set(model.prompts) >= set(sequential.model.prompts)
+        # the calls after a boundary in a window are the only extra ones
+        assert speculative.stats.llm_calls == sequential.stats.llm_calls + speculative.stats.mispredicted
+
+
+def test_query_speculative_sends_window_in_parallel():
+    model = FakeModel(delay=0.01)
+    determinor = Determinor(model=model, speculation_width=4)
+    determinor.query_batch_data(["s1", "s2", "s3", "s4"])
+
+    assert model.max_in_flight == 4
+
+
+def test_parse_boundaries():
+    assert parse_boundaries("Boundaries: none", 3) == set()
+    assert parse_boundaries(" boundaries: 1, 3.\n", 3) == {1, 3}
+    assert parse_boundaries("Boundaries: 4", 3) is None
+    assert parse_boundaries("Boundaries: 2, 2", 3) is None
+    assert parse_boundaries("The boundaries are 1 and 3", 3) is None
+
+
+def test_query_batched_matches_sequential_with_fewer_calls():
+    sentences = ["s1", "s2", "s3", "NEW s4", "s5", "s6", "s7", "s8", "NEW s9", "NEW s10", "s11"]
+    sequential = Determinor(model=FakeModel(), max_context_window=3)
+    expected = sequential.query_batch_data(sentences)
+
+    batched = Determinor(model=FakeModel(), max_context_window=3, batch_size=5)
+    assert batched.query_batch_data(sentences) == expected
+    assert list(batched.prev_paragraph) == list(sequential.prev_paragraph)
+    assert batched.stats.llm_calls == 3
+    assert batched.stats.decisions == len(sentences)
+    assert 0 < batched.stats.tokens_per_decision < sequential.stats.tokens_per_decision
+
+
+def test_query_batched_falls_back_on_malformed_output():
+    sentences = ["s1", "NEW s2", "s3"]
+    model = FakeModel(batch_response="I think sentence 2 is different.")
+    determinor = Determinor(model=model, batch_size=3)
+
+    assert determinor.query_batch_data(sentences) == [True, False, True]
+    assert determinor.stats.fallbacks == 1
+    assert determinor.stats.llm_calls == 4
+
+
+def test_context_window_in_tokens():
+    sentences = ["one two three four", "five six", "seven eight nine", "ten"]
+    determinor = Determinor(model=FakeModel(), max_context_window=10, max_context_tokens=6)
+    determinor.query_batch_data(sentences)
+
+    assert determinor.prev_paragraph.num_tokens <= 6
+    assert list(determinor.prev_paragraph)[-1] == "ten"
+
+
+def test_prompts_fit_max_prompt_tokens():
+    sentences = [" ".join(["word"] * n) for n in [30, 5, 40, 12, 25, 3]]
+    determinor = Determinor(model=FakeModel(), max_context_window=5)
+    max_prompt_tokens = determinor.query_template_tokens + 60
+    determinor.max_prompt_tokens = max_prompt_tokens
+    determinor.query_batch_data(sentences)
+
+    counts = determinor.stats.prompt_token_counts
+    assert len(counts) == len(sentences)
+    assert max(counts) <= max_prompt_tokens
+    distribution = determinor.stats.prompt_token_distribution()
+    assert distribution["max"] == max(counts) and distribution["min"] == min(counts)
+
+
+def test_find_verdict_waits_for_end_of_reasoning():
+    assert find_verdict("<think>Is it true? It could be fal") is None
+    assert find_verdict("<think>Is it true?</think>\n\nFa") is None
+    assert find_verdict("<think>Is it true?</think>\n\nFalse") == "\n\nFalse"
+    assert find_verdict("True") == "True"
+
+
+def test_stream_stops_at_verdict():
+    sentences = ["s1", "s2", "NEW s3", "s4"]
+    expected = Determinor(model=FakeModel()).query_batch_data(sentences)
+
+    model = FakeModel(reasoning="<think>Maybe true, maybe false. </think> ", explanation=" because " * 50)
+    determinor = Determinor(model=model, stream=True)
+    assert determinor.query_batch_data(sentences) == expected
+    assert determinor.stats.early_exits == len(sentences)
+    assert model.closed_streams == len(sentences)
+    # five reasoning chunks and the answer, the explanation is never generated
+    assert model.streamed_chunks == len(sentences) * 6
+    assert len(determinor.stats.verdict_seconds) == len(sentences)
+    assert determinor.stats.seconds_saved_per_call(full_response_seconds=1.0) > 0.9
+
+
+class LogprobModel(FakeModel):
+    """Chat model answering with a single token and its top logprobs, P(True) is 0.9 or 0.2."""
+
+    def invoke(self, prompt):
+        p_true = 0.9 if super().invoke(prompt) == "True" else 0.2
+        top_logprobs = [
+            {"token": "True", "logprob": math.log(p_true * 0.98)},
+            {"token": "False", "logprob": math.log((1 - p_true) * 0.98)},
+            {"token": "Yes", "logprob": math.log(0.02)},
+        ]
+        token = max(top_logprobs, key=lambda candidate: candidate["logprob"])
+        return AIMessage(
+            content=token["token"],
+            response_metadata={"logprobs": {"content": [{**token, "top_logprobs": top_logprobs}]}},
+        )
+
+
+def test_constrained_verdict_from_logprobs():
+    sentences = ["s1", "s2", "NEW s3", "s4"]
+    determinor = Determinor(model=LogprobModel(), constrained=True)
+
+    assert determinor.query_batch_data(sentences) == [True, True, False, True]
+    assert [round(c, 6) for c in determinor.confidences] == [0.9, 0.9, 0.2, 0.9]
+    assert apply_threshold(determinor.confidences, 0.1) == [True] * 4
+
+    strict = Determinor(model=LogprobModel(), constrained=True, confidence_threshold=0.95)
+    assert strict.query_batch_data(sentences) == [False] * 4
+
+
+def test_constrained_confidences_of_concurrent_documents():
+    documents = [["s1", "NEW s2"], ["NEW t1", "t2", "t3"]]
+    determinor = Determinor(model=LogprobModel(), constrained=True, max_workers=2)
+
+    predictions = determinor.query_batch_documents(documents)
+    assert predictions == [[True, False], [False, True, True]]
+    # in document order, aligned with the concatenated predictions
+    assert [round(c, 6) for c in determinor.confidences] == [0.9, 0.2, 0.2, 0.9, 0.9]
+    assert apply_threshold(determinor.confidences, 0.5) == sum(predictions, [])
+
+
+def test_constrained_verdict_without_logprobs():
+    determinor = Determinor(model=FakeModel(), constrained=True)
+
+    assert determinor.query_batch_data(["s1", "NEW s2"]) == [True, False]
+    assert determinor.confidences == [None, None]
+
+
+class FakeEmbeddings:
+    """Embeds a sentence as the mix of the topics named by its lowercase letters."""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(texts)
+        return [[float(text.count(topic)) for topic in "abc"] for text in texts]
+
+
+def test_prefilter_escalates_only_ambiguous_sentences():
+    # "NEW" marks the boundaries the model would find
+    sentences = ["a", "a", "a", "b", "b", "NEW ab", "c"]
+    embeddings = FakeEmbeddings()
+    model = FakeModel()
+    determinor = Determinor(model=model, similarity_thresholds=(0.3, 0.9), embedding_function=embeddings)
+
+    assert determinor.query_batch_data(sentences) == [True, True, True, False, True, False, False]
+    assert len(embeddings.batches) == 1
+    # the first sentence has no context and "NEW ab" is half similar to "b"
+    assert len(model.prompts) == 2
+    assert determinor.stats.prefiltered == 5
+    assert determinor.stats.escalated == 1
+    assert determinor.stats.escalated_fraction == 1 / 6
+
+
+def test_prefilter_is_not_embedded_for_batched_or_speculative_queries():
+    embeddings = FakeEmbeddings()
+    for kwargs in [{"batch_size": 3}, {"speculation_width": 3}]:
+        determinor = Determinor(model=FakeModel(), similarity_thresholds=(0.3, 0.9), embedding_function=embeddings, **kwargs)
+        determinor.query_batch_data(["a", "a", "NEW b"])
+
+    assert embeddings.batches == []
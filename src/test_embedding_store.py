@@ -0,0 +1,75 @@
+import numpy as np
+
+from src.embedding_store import CachedEmbeddings, EmbeddingStore
+from src.test_determinor import FakeEmbeddings
+
+
+class QueryEmbeddings(FakeEmbeddings):
+    def embed_query(self, text):
+        self.batches.append([text])
+        return [-1.0, 0.0, 0.0]
+
+
+def test_embeds_each_text_once(tmp_path):
+    embeddings = FakeEmbeddings()
+    cached = CachedEmbeddings(embeddings, store=EmbeddingStore(str(tmp_path)), model_id="fake", batch_size=2)
+
+    assert cached.embed_documents(["a", "b", "a", "c", "ab"]) == [[1, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 1], [1, 1, 0]]
+    # duplicates dropped, then batches of two
+    assert embeddings.batches == [["a", "b"], ["c", "ab"]]
+    assert cached.embed_documents(["c", "a"]) == [[0, 0, 1], [1, 0, 0]]
+    assert len(embeddings.batches) == 2
+    assert cached.stats == {"hits": 2, "misses": 4, "hit_rate": 1 / 3, "entries": 4}
+
+
+def test_vectors_persist_across_stores(tmp_path):
+    CachedEmbeddings(FakeEmbeddings(), store=EmbeddingStore(str(tmp_path)), model_id="fake").embed_documents(["a", "b"])
+    embeddings = FakeEmbeddings()
+    # a second store appends to the file mapped by the first
+    cached = CachedEmbeddings(embeddings, store=EmbeddingStore(str(tmp_path)), model_id="fake")
+
+    assert np.array_equal(cached.embed(["b", "c", "a"]), [[0, 1, 0], [0, 0, 1], [1, 0, 0]])
+    assert embeddings.batches == [["c"]]
+    # another model does not share vectors
+    other = CachedEmbeddings(FakeEmbeddings(), store=cached.store, model_id="other")
+    other.embed_documents(["a"])
+    assert other.stats["misses"] == 1
+
+
+def test_query_embeddings_are_kept_apart(tmp_path):
+    embeddings = QueryEmbeddings()
+    cached = CachedEmbeddings(embeddings, store=EmbeddingStore(str(tmp_path)), model_id="fake")
+
+    assert cached.embed_documents(["a"]) == [[1, 0, 0]]
+    assert cached.embed_query("a") == [-1, 0, 0]
+    assert cached.embed_query("a") == [-1, 0, 0]
+    assert len(embeddings.batches) == 2
+
+
+class BatchQueryEmbeddings(QueryEmbeddings):
+    def embed_queries(self, texts):
+        self.batches.append(texts)
+        return [[-1.0, 0.0, 0.0] for _ in texts]
+
+
+def test_queries_are_embedded_in_batches(tmp_path):
+    embeddings = BatchQueryEmbeddings()
+    cached = CachedEmbeddings(embeddings, store=EmbeddingStore(str(tmp_path)), model_id="fake", batch_size=2)
+
+    assert cached.embed(["a", "b", "c"], query=True).tolist() == [[-1, 0, 0]] * 3
+    assert embeddings.batches == [["a", "b"], ["c"]]
+
+
+def test_partly_written_row_is_ignored(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("fake", ["a", "b"], np.eye(3)[:2])
+    # a put stopped halfway through writing its vector
+    file, _ = store.model_file("fake")
+    with open(file, "ab") as f:
+        f.write(np.ones(3, dtype=np.float32).tobytes()[:6])
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert np.array_equal(reopened.get("fake", ["b", "a"])["b"], [0, 1, 0])
+    reopened.put("fake", ["c"], [[0.0, 0.0, 1.0]])
+    found = EmbeddingStore(str(tmp_path)).get("fake", ["a", "b", "c"])
+    assert {h: v.tolist() for h, v in found.items()} == {"a": [1, 0, 0], "b": [0, 1, 0], "c": [0, 0, 1]}
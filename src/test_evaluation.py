@@ -0,0 +1,13 @@
+from src.evaluation import evaluate, predictions_to_labels
+
+
+def test_predictions_to_labels():
+    assert predictions_to_labels([True, False, True]) == [0, 1, 0]
+
+
+def test_evaluate_perfect_and_skips_long_windows():
+    labels = [1, 0, 0, 1, 0, 0, 0, 1, 0, 0]
+    predictions = [label == 0 for label in labels]
+    scores = evaluate(labels, predictions, ks=[2, 3, 20])
+
+    assert scores == {2: {"pk": 0.0, "wd": 0.0}, 3: {"pk": 0.0, "wd": 0.0}}
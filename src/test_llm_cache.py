@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from src.determinor import Determinor
+from src.llm_cache import ResponseCache
+from src.test_determinor import FakeModel
+
+
+def test_get_put_counts_hits_and_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    key = cache.key("mistral", None, "template", "prompt")
+
+    assert cache.get(key) is None
+    cache.put(key, "True")
+    assert cache.get(key) == "True"
+    assert cache.stats == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_key_depends_on_every_field():
+    key = ResponseCache.key("mistral", None, "template", "prompt")
+
+    assert key != ResponseCache.key("gpt-4o-mini", None, "template", "prompt")
+    assert key != ResponseCache.key("mistral", 1, "template", "prompt")
+    assert key != ResponseCache.key("mistral", None, "other template", "prompt")
+    assert key != ResponseCache.key("mistral", None, "template", "other prompt")
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put("a", "True")
+    cache.put("b", "True")
+    cache.get("a")
+    cache.put("c", "False")
+
+    assert cache.stats["entries"] == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "True"
+
+
+def test_replacing_an_entry_does_not_count_it_twice(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    cache.put("a", "True")
+    cache.put("b", "True")
+    cache.put("b", "False")
+
+    assert cache.stats["entries"] == 2
+    assert cache.get("a") == "True"
+    assert cache.get("b") == "False"
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_age=-1)
+    cache.put("a", "True")
+
+    assert cache.get("a") is None
+
+
+def test_read_only_cache_never_writes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(path).put("a", "True")
+
+    cache = ResponseCache(path, read_only=True)
+    cache.put("b", "False")
+    assert cache.get("a") == "True"
+    assert cache.get("b") is None
+    with pytest.raises(sqlite3.OperationalError):
+        ResponseCache(str(tmp_path / "missing.db"), read_only=True)
+
+
+def test_determinor_rerun_is_served_from_cache(tmp_path):
+    sentences = ["s1", "s2", "NEW s3", "s4"]
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    expected = Determinor(model=FakeModel(), cache=cache).query_batch_data(sentences)
+
+    model = FakeModel()
+    assert Determinor(model=model, cache=cache).query_batch_data(sentences) == expected
+    assert model.prompts == []
+    assert cache.stats["hits"] == len(sentences)
@@ -0,0 +1,130 @@
+import pytest
+
+from src import populate_database as populate
+from src.populate_database import iter_chunks, iter_files, populate_database
+from src.test_determinor import FakeEmbeddings
+from src.vector_index import VectorIndex
+
+
+class CountingIndex(VectorIndex):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def add_documents(self, documents, ids=None):
+        self.batches.append(len(documents))
+        return super().add_documents(documents, ids)
+
+
+def write_corpus(path):
+    for i in range(5):
+        directory = path / str(i % 2)
+        directory.mkdir(exist_ok=True)
+        (directory / f"{i}.ref").write_text("\n".join(f"sentence {j} of file {i} about abc." for j in range(60)))
+    (path / ".hidden").write_text("skipped")
+
+
+def test_parallel_chunks_match_sequential(tmp_path):
+    write_corpus(tmp_path)
+    files = list(iter_files([str(tmp_path)]))
+
+    assert [f[len(str(tmp_path)) + 1:] for f in files] == ["0/0.ref", "0/2.ref", "0/4.ref", "1/1.ref", "1/3.ref"]
+    sequential = [chunk.page_content for chunk in iter_chunks(files, max_workers=1)]
+    assert [chunk.page_content for chunk in iter_chunks(iter(files), max_workers=2)] == sequential
+
+
+def test_ingestion_is_batched_and_resumable(tmp_path):
+    (tmp_path / "data").mkdir()
+    write_corpus(tmp_path / "data")
+    index = CountingIndex(str(tmp_path / "index"), embedding_function=FakeEmbeddings())
+    populate_database([str(tmp_path / "data" / "0")], db=index, max_workers=2, batch_size=4)
+
+    num_chunks = len(index)
+    assert index.batches[:-1] == [4] * (len(index.batches) - 1)
+    assert sum(index.batches) == num_chunks
+
+    # a second run only adds the files that were not ingested yet
+    index = CountingIndex(str(tmp_path / "index"), embedding_function=FakeEmbeddings())
+    populate_database([str(tmp_path / "data")], db=index, max_workers=2, batch_size=4)
+    assert sum(index.batches) == len(index) - num_chunks
+    assert len(set(index.get(include=[])["ids"])) == len(index)
+
+
+def test_only_changed_files_are_reindexed(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_corpus(data)
+    embeddings = FakeEmbeddings()
+    index = CountingIndex(str(tmp_path / "index"), embedding_function=embeddings)
+    populate_database([str(data)], db=index, max_workers=1)
+    ids = set(index.get(include=[])["ids"])
+
+    # an unchanged corpus is neither read nor embedded again
+    index.batches.clear()
+    embeddings.batches.clear()
+    populate_database([str(data)], db=index, max_workers=1)
+    assert index.batches == []
+    assert embeddings.batches == []
+
+    # an edited file only adds its changed chunks and deletes the ones it lost
+    edited = data / "0" / "2.ref"
+    lines = edited.read_text().split("\n")
+    edited.write_text("\n".join(lines[:-5] + ["a new last sentence."]))
+    (data / "1" / "3.ref").unlink()
+    populate_database([str(data)], db=index, max_workers=1)
+
+    new_ids = set(index.get(include=[])["ids"])
+    assert sum(index.batches) == len(new_ids - ids) == 1
+    assert all(id.startswith(str(edited)) for id in new_ids - ids)
+    assert not any(id.startswith(str(data / "1" / "3.ref")) for id in new_ids)
+    assert len(ids - new_ids) == 1 + len([id for id in ids if id.startswith(str(data / "1" / "3.ref"))])
+
+
+def test_removed_files_are_purged_under_unnormalized_paths(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_corpus(data)
+    index = VectorIndex(str(tmp_path / "index"), embedding_function=FakeEmbeddings())
+    populate_database([f"{tmp_path}/./data/"], db=index, max_workers=1)
+    removed = str(data / "1" / "3.ref")
+    assert any(id.startswith(removed) for id in index.get(include=[])["ids"])
+
+    (data / "1" / "3.ref").unlink()
+    populate_database([f"{tmp_path}/./data/"], db=index, max_workers=1)
+    assert not any(id.startswith(removed) for id in index.get(include=[])["ids"])
+
+
+def test_store_without_manifest_is_refused(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_corpus(data)
+    index = VectorIndex(str(tmp_path / "index"), embedding_function=FakeEmbeddings())
+    index.add_texts(["added without a manifest"], ids=[f"{data}/0/0.ref:0:0"])
+
+    with pytest.raises(ValueError, match="--reset"):
+        populate_database([str(data)], db=index, max_workers=1)
+    assert len(index) == 1
+
+
+def test_files_are_split_again_when_the_splitter_changes(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_corpus(data)
+    index = CountingIndex(str(tmp_path / "index"), embedding_function=FakeEmbeddings())
+    populate_database([str(data)], db=index, max_workers=1)
+    num_chunks = len(index.get(include=[])["ids"])
+
+    monkeypatch.setattr(populate, "CHUNK_SIZE", 400)
+    index.batches.clear()
+    populate_database([str(data)], db=index, max_workers=1)
+
+    ids = set(index.get(include=[])["ids"])
+    assert len(ids) > num_chunks
+    fresh = VectorIndex(str(tmp_path / "fresh"), embedding_function=FakeEmbeddings())
+    populate_database([str(data)], db=fresh, max_workers=1)
+    assert ids == set(fresh.get(include=[])["ids"])
+
+    # the same settings again skip every file
+    index.batches.clear()
+    populate_database([str(data)], db=index, max_workers=1)
+    assert index.batches == []
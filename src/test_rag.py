@@ -1,5 +1,4 @@
-from langchain_community.llms.ollama import Ollama
-
+from .backends import get_model
 from .query_data import query_rag
 
 
@@ -31,7 +30,7 @@ def query_and_validate(question: str, expected_response: str):
         expected_response=expected_response, actual_response=response_text
     )
 
-    model = Ollama(model="mistral")
+    model = get_model("mistral")
     evaluation_results_str = model.invoke(prompt)
     evaluation_results_str_cleaned = evaluation_results_str.strip().lower()
 
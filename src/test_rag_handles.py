@@ -0,0 +1,71 @@
+import chromadb
+from langchain.vectorstores.chroma import Chroma
+
+from src.rag import RAG
+from src.test_determinor import FakeModel
+
+
+class CountingEmbeddings:
+    """Embeds texts by their counts of the letters a, b and c."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts, query=False):
+        self.calls.append(texts)
+        return [[float(text.count(topic)) for topic in "abc"] for text in texts]
+
+    def embed_documents(self, texts):
+        return self.embed(texts)
+
+    def embed_query(self, text):
+        return self.embed([text], query=True)[0]
+
+
+def make_rag(collection_name, **kwargs):
+    embeddings = CountingEmbeddings()
+    db = Chroma(collection_name=collection_name, client=chromadb.EphemeralClient(), embedding_function=embeddings)
+    db.add_texts(["aaa", "bbb", "ccc"], ids=["a", "b", "c"])
+    embeddings.calls.clear()
+    return RAG(model=FakeModel(), embedding_function=embeddings, db=db, **kwargs), embeddings
+
+
+def test_query_batch_data_embeds_all_pairs_at_once():
+    rag, embeddings = make_rag("batch", k=1)
+    predictions = rag.query_batch_data(["a", "b", "c", "a"])
+
+    assert len(predictions) == 3
+    assert len(embeddings.calls) == 1
+    assert len(embeddings.calls[0]) == 3
+    assert len(rag.model.prompts) == 3
+    # the pair prompt is answered with the retrieved chunk as context
+    assert "aaa" in rag.model.prompts[0]
+
+
+def test_handles_are_reused():
+    rag, _ = make_rag("reuse")
+    db = rag.db
+    rag.query_data("a")
+    rag.query_data("b")
+
+    assert rag.db is db
+    assert len(rag.model.prompts) == 2
+
+
+def test_context_manager_closes_owned_store(tmp_path):
+    with RAG(model=FakeModel(), embedding_function=CountingEmbeddings(), persist_directory=str(tmp_path)) as rag:
+        client = rag.db._client
+    assert rag.db is None
+    assert client._closed
+
+
+def test_search_batch_matches_single_searches():
+    rag, embeddings = make_rag("search", k=2)
+    queries = ["a", "bb", "cab"]
+    batched = rag.search_batch(rag.embed_queries(queries), k=2)
+
+    for query, results in zip(queries, batched):
+        expected = rag.db.similarity_search_with_score(query, k=2)
+        assert [(doc.page_content, round(score, 5)) for doc, score in results] == [
+            (doc.page_content, round(score, 5)) for doc, score in expected
+        ]
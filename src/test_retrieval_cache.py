@@ -0,0 +1,44 @@
+from src.retrieval_cache import RetrievalCache
+from src.test_rag_handles import make_rag
+
+
+def test_lru_eviction():
+    cache = RetrievalCache(max_entries=2)
+    cache.put("a", 5, ["a"])
+    cache.put("b", 5, ["b"])
+    assert cache.get("a", 5) == ["a"]
+    cache.put("c", 5, ["c"])
+
+    assert cache.get("b", 5) is None
+    assert cache.get("a", 5) == ["a"]
+    assert cache.get("a", 3) is None
+    assert cache.stats == {"hits": 2, "similar_hits": 0, "misses": 2, "hit_rate": 0.5, "entries": 2, "evictions": 1}
+
+
+def test_similar_queries_share_results():
+    cache = RetrievalCache(similarity_threshold=0.9)
+    cache.put("a", 5, ["a"], embedding=[1.0, 0.0])
+    cache.put("b", 5, ["b"], embedding=[0.0, 1.0])
+
+    assert cache.get("almost a", 5, embedding=[1.0, 0.1]) == ["a"]
+    assert cache.get("between", 5, embedding=[1.0, 1.0]) is None
+    assert cache.get("almost a", 3, embedding=[1.0, 0.1]) is None
+    # without the embedding only exact queries hit
+    assert cache.get("almost a", 5) is None
+    assert cache.stats["similar_hits"] == 1
+
+
+def test_rag_searches_repeated_pairs_once():
+    rag, embeddings = make_rag("cache", k=1, cache=RetrievalCache())
+    searches = []
+    search_batch = rag.search_batch
+    rag.search_batch = lambda query_embeddings, k: searches.append(len(query_embeddings)) or search_batch(query_embeddings, k)
+
+    first = rag.query_batch_data(["a", "b", "a", "b"])
+    second = rag.query_batch_data(["a", "b", "c"])
+
+    assert first == second[:2] + [first[2]]
+    # "a"/"b" and "b"/"a" are searched by the first document, only "b"/"c" by the second
+    assert searches == [2, 1]
+    assert rag.cache.stats["hits"] == 1
+    assert rag.cache.stats["entries"] == 3
@@ -0,0 +1,32 @@
+import numpy as np
+
+from src.segmenter import EmbeddingSegmenter, block_similarities, normalize
+from src.test_determinor import FakeEmbeddings
+
+
+def test_block_similarities_match_similarity_matrix():
+    embeddings = normalize(np.random.default_rng(0).normal(size=(12, 8)))
+    matrix = embeddings @ embeddings.T
+    expected = [matrix[max(0, i - 3):i, i:i + 3].mean() for i in range(1, 12)]
+
+    assert np.allclose(block_similarities(embeddings, 3), expected)
+
+
+def test_finds_topic_changes():
+    sentences = ["a"] * 6 + ["b"] * 5 + ["c"] * 7
+    embeddings = FakeEmbeddings()
+    segmenter = EmbeddingSegmenter(embedding_function=embeddings)
+    predictions = segmenter.query_batch_data(sentences)
+
+    assert len(predictions) == len(sentences)
+    assert [i for i, p in enumerate(predictions) if not p] == [6, 11]
+    assert len(embeddings.batches) == 1
+
+
+def test_query_batch_documents_embeds_once():
+    embeddings = FakeEmbeddings()
+    segmenter = EmbeddingSegmenter(embedding_function=embeddings)
+    documents = [["a"] * 4 + ["b"] * 4, ["c"] * 2]
+
+    assert segmenter.query_batch_documents(documents) == [[True] * 4 + [False] + [True] * 3, [True, True]]
+    assert len(embeddings.batches) == 1
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from langchain.schema.document import Document
+
+from src.rag import RAG
+from src.test_determinor import FakeEmbeddings, FakeModel
+from src.test_rag_handles import CountingEmbeddings
+from src.vector_index import VectorIndex
+
+
+def test_add_get_and_search(tmp_path):
+    index = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    index.add_documents([Document(page_content="aa", metadata={"id": "x:1:0"}), Document(page_content="bb")], ids=["x:1:0", "x:1:1"])
+    index.add_texts(["cc"], ids=["x:2:0"])
+
+    assert index.get(include=[]) == {"ids": ["x:1:0", "x:1:1", "x:2:0"]}
+    [(document, score)] = index.similarity_search_with_score("b", k=1)
+    assert document.page_content == "bb"
+    assert score == 1.0
+
+    # reopened from disk
+    reopened = VectorIndex(str(tmp_path))
+    assert reopened.get()["metadatas"][0] == {"id": "x:1:0"}
+    assert [d.page_content for d, _ in reopened.similarity_search_by_vector_with_relevance_scores([2.0, 0.0, 0.0], k=2)] == ["aa", "bb"]
+
+
+def test_brute_force_batch_matches_single_queries(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(1200, 16)).astype(np.float32)
+    queries = rng.normal(size=(50, 16)).astype(np.float32)
+    index = VectorIndex(str(tmp_path))
+    index.add_embeddings([str(i) for i in range(1200)], vectors)
+
+    found = index.similarity_search_batch(queries, k=10)
+    single = [index.similarity_search_by_vector_with_relevance_scores(query, k=10) for query in queries]
+    assert [[d.page_content for d, _ in result] for result in found] == [[d.page_content for d, _ in result] for result in single]
+    distances = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+    exact = np.argsort(distances, axis=1)[:, :10]
+    assert [[d.page_content for d, _ in result] for result in found] == [[str(i) for i in row] for row in exact]
+    assert np.allclose([[score for _, score in result] for result in found], np.take_along_axis(distances, exact, axis=1), atol=1e-3)
+
+
+def test_duplicate_ids_in_one_add_are_refused(tmp_path):
+    index = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    with pytest.raises(ValueError):
+        index.add_texts(["aa", "bb"], ids=["x", "x"])
+
+    assert len(index) == 0
+    assert index.get(include=[]) == {"ids": []}
+
+
+def test_rag_searches_vector_index(tmp_path):
+    embeddings = FakeEmbeddings()
+    index = VectorIndex(str(tmp_path))
+    index.add_embeddings(["aaa", "bbb"], embeddings.embed_documents(["aaa", "bbb"]))
+    rag = RAG(model=FakeModel(), embedding_function=CountingEmbeddings(), db=index, k=1)
+
+    [[(document, _)]] = rag.search_batch(rag.embed_queries(["bb"]), k=1)
+    assert document.page_content == "bbb"
+    assert len(rag.query_batch_data(["a", "b", "a"])) == 2
+
+
+def test_delete_and_replace(tmp_path):
+    index = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    index.add_texts(["aa", "bb", "cc"], ids=["a", "b", "c"])
+    index.delete(["b", "missing"])
+    index.add_texts(["ab"], ids=["a"])
+
+    reopened = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    assert reopened.get(include=[]) == {"ids": ["c", "a"]}
+    assert reopened.get(ids=["a", "b"])["documents"] == ["ab"]
+    assert [d.page_content for d, _ in reopened.similarity_search_with_score("b", k=5)] == ["ab", "cc"]
+
+
+def test_interrupted_add_is_cut_back_on_open(tmp_path):
+    index = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    index.add_texts(["aa", "bb", "cc"], ids=["a", "b", "c"])
+    # an add stopped after writing its vector, chunk and id but before committing
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.ones(3, dtype=np.float32).tobytes())
+    with open(tmp_path / "documents.jsonl", "a") as f:
+        f.write('{"page_content": "dd", "metadata": {}}\n')
+    with open(tmp_path / "ids.txt", "a") as f:
+        f.write("d\n")
+
+    reopened = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    assert len(reopened) == 3
+    assert len(reopened.similarity_search_batch([[1.0, 1.0, 1.0]], k=5)[0]) == 3
+    reopened.add_texts(["dd"], ids=["d"])
+
+    reopened = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    assert reopened.get()["documents"] == ["aa", "bb", "cc", "dd"]
+    assert reopened.get(include=[]) == {"ids": ["a", "b", "c", "d"]}
+
+
+def test_interrupted_first_add_leaves_an_empty_index(tmp_path):
+    with open(tmp_path / "vectors.f32", "wb") as f:
+        f.write(np.ones(3, dtype=np.float32).tobytes())
+    with open(tmp_path / "ids.txt", "w") as f:
+        f.write("a\n")
+
+    index = VectorIndex(str(tmp_path), embedding_function=CountingEmbeddings())
+    assert len(index) == 0
+    index.add_texts(["bb"], ids=["b"])
+    assert VectorIndex(str(tmp_path)).get() == {"ids": ["b"], "documents": ["bb"], "metadatas": [{}]}
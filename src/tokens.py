@@ -0,0 +1,57 @@
+import functools
+
+# tiktoken ships with langchain-openai, its cl100k_base encoding is a close
+# enough approximation of the token counts of the local models as well
+ENCODING_NAME = "cl100k_base"
+# sentences whose token counts are remembered by a TokenCounter
+MAX_CACHED_SENTENCES = 100000
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(encoding_name=ENCODING_NAME):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        # tiktoken is missing or its encoding cannot be downloaded
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer_for_model(model_id: str = None):
+    """Return the tokenizer of an OpenAI model, or the default approximation for other models."""
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model_id)
+    except Exception:
+        return get_tokenizer()
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text.split())
+    return len(tokenizer.encode(text))
+
+
+class TokenCounter:
+    """Counts tokens with a model's tokenizer, remembering the counts of sentences.
+
+    Calling the counter caches the count of the text, which suits sentences
+    that are counted again every time they are part of a context window.
+    count() does not cache and is meant for one-off texts such as prompts.
+    """
+
+    def __init__(self, model_id: str = None, max_cached=MAX_CACHED_SENTENCES):
+        self.tokenizer = get_tokenizer_for_model(model_id)
+        self.cached_count = functools.lru_cache(maxsize=max_cached)(self.count)
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is None:
+            return len(text.split())
+        return len(self.tokenizer.encode(text))
+
+    def __call__(self, text: str) -> int:
+        return self.cached_count(text)
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+
+import numpy as np
+from langchain.schema.document import Document
+
+INDEX_PATH = "vector_index"
+
+
+class VectorIndex:
+    """In-process vector store persisted in a directory, an alternative to Chroma.
+
+    Vectors are appended to a float32 file read through a memory map. The
+    ids are kept in ids.txt and the chunks in documents.jsonl, whose lines
+    are read on demand through a byte offset array. meta.json holds the
+    number of committed rows, an interrupted add is cut back to it on open.
+    Deleted and replaced rows are only marked in a mask and skipped by
+    searches. Scores are squared L2 distances like Chroma's default, found
+    by brute force with one matrix product per batch of queries.
+    """
+
+    def __init__(self, persist_directory=INDEX_PATH, embedding_function=None):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.lock = threading.Lock()
+        os.makedirs(persist_directory, exist_ok=True)
+
+        self.dim = None
+        num_rows = 0
+        meta_path = self.file("meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            num_rows = meta["rows"]
+        self.offsets = np.load(self.file("offsets.npy")) if os.path.exists(self.file("offsets.npy")) else np.zeros(1, dtype=np.int64)
+        self.truncate(num_rows)
+        self.vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        if num_rows > 0:
+            self.vectors = np.asarray(np.memmap(self.file("vectors.f32"), dtype=np.float32, mode="r")).reshape(-1, self.dim)
+            self.norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self.deleted = np.zeros(len(self.vectors), dtype=bool)
+        if os.path.exists(self.file("deleted.npy")):
+            # rows added after the last delete are not in the saved mask
+            deleted = np.load(self.file("deleted.npy"))[:num_rows]
+            self.deleted[:len(deleted)] = deleted
+        # read on first use
+        self.ids = None
+        self.rows = None
+
+    def file(self, name):
+        return os.path.join(self.persist_directory, name)
+
+    def truncate(self, num_rows):
+        """Drop what an interrupted add wrote after the last committed row.
+
+        An add appends to vectors.f32, documents.jsonl and ids.txt, replaces
+        offsets.npy, and commits by replacing meta.json with the new number
+        of rows. Anything past that number is cut off here.
+        """
+        row_bytes = 4 * (self.dim or 0)
+        vectors_path = self.file("vectors.f32")
+        if not os.path.exists(vectors_path) or os.path.getsize(vectors_path) <= num_rows * row_bytes:
+            return
+        with open(vectors_path, "r+b") as f:
+            f.truncate(num_rows * row_bytes)
+        self.offsets = self.offsets[:num_rows + 1]
+        self.save_array("offsets.npy", self.offsets)
+        if os.path.exists(self.file("documents.jsonl")):
+            with open(self.file("documents.jsonl"), "r+b") as f:
+                f.truncate(int(self.offsets[-1]))
+        if os.path.exists(self.file("ids.txt")):
+            with open(self.file("ids.txt"), encoding="utf-8") as f:
+                ids = f.read().splitlines()[:num_rows]
+            self.replace_file("ids.txt", "".join(f"{id}\n" for id in ids).encode("utf-8"))
+
+    def replace_file(self, name, data: bytes):
+        # written next to the file and renamed over it, so readers see the old or the new contents
+        with open(self.file(name + ".tmp"), "wb") as f:
+            f.write(data)
+        os.replace(self.file(name + ".tmp"), self.file(name))
+
+    def save_array(self, name, array):
+        with open(self.file(name + ".tmp"), "wb") as f:
+            np.save(f, array)
+        os.replace(self.file(name + ".tmp"), self.file(name))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def get(self, ids: list[str] = None, include=None, limit=None) -> dict:
+        """Return the ids of the stored chunks (all or those among ids), with their documents and metadatas when included."""
+        include = include if include is not None else ["documents", "metadatas"]
+        self.load_ids()
+        if ids is None:
+            rows = sorted(self.rows.values())
+        else:
+            rows = [self.rows[id] for id in ids if id in self.rows]
+        rows = rows[:limit]
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include or "metadatas" in include:
+            documents = self.documents(rows)
+            if "documents" in include:
+                result["documents"] = [document.page_content for document in documents]
+            if "metadatas" in include:
+                result["metadatas"] = [document.metadata for document in documents]
+        return result
+
+    def load_ids(self):
+        if self.ids is None:
+            path = self.file("ids.txt")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    self.ids = f.read().splitlines()
+            else:
+                self.ids = []
+            self.rows = {id: row for row, id in enumerate(self.ids) if not self.deleted[row]}
+        return self.ids
+
+    def delete(self, ids: list[str]):
+        with self.lock:
+            self.mark_deleted(ids)
+
+    def mark_deleted(self, ids):
+        self.load_ids()
+        rows = [self.rows.pop(id) for id in ids if id in self.rows]
+        if rows:
+            self.deleted[rows] = True
+            self.save_array("deleted.npy", self.deleted)
+
+    def documents(self, rows) -> list[Document]:
+        documents = []
+        with open(self.file("documents.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(self.offsets[row])
+                item = json.loads(f.read(self.offsets[row + 1] - self.offsets[row]))
+                documents.append(Document(page_content=item["page_content"], metadata=item["metadata"]))
+        return documents
+
+    def add_documents(self, documents: list[Document], ids: list[str] = None):
+        texts = [document.page_content for document in documents]
+        return self.add_texts(texts, [document.metadata for document in documents], ids)
+
+    def add_texts(self, texts: list[str], metadatas: list[dict] = None, ids: list[str] = None):
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids)
+
+    def add_embeddings(self, texts: list[str], embeddings, metadatas: list[dict] = None, ids: list[str] = None):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+        ids = ids if ids is not None else [str(len(self) + i) for i in range(len(texts))]
+        assert len(texts) == len(embeddings) == len(metadatas) == len(ids), "Texts, embeddings, metadatas and ids must have the same length."
+        if len(set(ids)) != len(ids):
+            raise ValueError("Ids must be unique within one add.")
+        if not texts:
+            return []
+        with self.lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {embeddings.shape[1]}.")
+            self.load_ids()
+            # files of an add that failed in this process are cut back first
+            self.truncate(len(self))
+
+            with open(self.file("vectors.f32"), "ab") as f:
+                f.write(embeddings.tobytes())
+            lines = [
+                (json.dumps({"page_content": text, "metadata": metadata}) + "\n").encode("utf-8")
+                for text, metadata in zip(texts, metadatas)
+            ]
+            with open(self.file("documents.jsonl"), "ab") as f:
+                f.writelines(lines)
+            offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum([len(line) for line in lines])])
+            self.save_array("offsets.npy", offsets)
+            with open(self.file("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{id}\n" for id in ids))
+            # the rows exist once meta.json counts them
+            self.replace_file("meta.json", json.dumps({"dim": self.dim, "rows": len(self) + len(ids)}).encode("utf-8"))
+
+            self.offsets = offsets
+            self.vectors = np.asarray(np.memmap(self.file("vectors.f32"), dtype=np.float32, mode="r")).reshape(-1, self.dim)
+            self.norms = np.concatenate([self.norms, np.einsum("ij,ij->i", embeddings, embeddings)])
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+            # stored chunks with the same ids are replaced, after the commit so
+            # an interrupted add never loses the chunks it was replacing
+            self.mark_deleted(ids)
+            self.rows.update((id, len(self.ids) + i) for i, id in enumerate(ids))
+            self.ids.extend(ids)
+        return ids
+
+    def persist(self):
+        # every change is written to disk when it is made
+        pass
+
+    def search_brute(self, queries: np.ndarray, k: int):
+        distances = self.norms[None, :] - 2 * (queries @ self.vectors.T) + np.einsum("ij,ij->i", queries, queries)[:, None]
+        distances[:, self.deleted] = np.inf
+        k = min(k, len(self) - int(self.deleted.sum()))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        return np.take_along_axis(nearest, order, axis=1), np.take_along_axis(nearest_distances, order, axis=1)
+
+    def similarity_search_batch(self, query_embeddings, k=4) -> list[list[tuple[Document, float]]]:
+        """Return the k nearest chunks and their distances for every query embedding."""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if len(self) == self.deleted.sum():
+            return [[] for _ in queries]
+        found = [(list(rows), list(distances)) for rows, distances in zip(*self.search_brute(queries, k))]
+        documents = iter(self.documents([int(row) for rows, _ in found for row in rows]))
+        return [[(next(documents), float(distance)) for distance in distances] for _, distances in found]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        return self.similarity_search_batch([embedding], k)[0]
+
+    def similarity_search_with_score(self, query: str, k=4):
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding_function.embed_query(query), k)